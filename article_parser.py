@@ -0,0 +1,97 @@
+import asyncio
+import datetime as dt
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from newspaper import Config
+from newspaper.article import Article
+
+from near_duplicates import minhash_signature
+
+PARSE_CONFIG = Config()
+PARSE_CONFIG.memorize_articles = False
+PARSE_CONFIG.disable_category_cache = True
+
+
+@dataclass
+class ParsedArticle:
+    """
+    The fields of a parsed newspaper Article that the collector checks and writes.
+    """
+
+    url: str
+    title: str
+    text: str
+    publish_date: Optional[dt.datetime]
+    meta_description: str
+    top_image: str
+    images: list[str]
+    minhash: bytes
+    # Seconds spent parsing in the worker, without time waiting for a free process
+    parse_seconds: float = 0.0
+
+
+def parse_article_html(url: str, html: str) -> Optional[ParsedArticle]:
+    """
+    Parse downloaded html with newspaper. Returns None if parsing fails.
+    Module level so it can be sent to worker processes.
+    """
+    start = time.perf_counter()
+    article = Article(url, config=PARSE_CONFIG)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            article.download(input_html=html)
+            article.parse()
+        except Exception:
+            return None
+    return ParsedArticle(
+        url=url,
+        title=article.title,
+        text=article.text,
+        publish_date=article.publish_date,
+        meta_description=article.meta_description,
+        top_image=article.top_image,
+        images=list(article.images),
+        minhash=minhash_signature(article.text),
+        parse_seconds=time.perf_counter() - start,
+    )
+
+
+class ArticleParser:
+    """
+    Parses html in a pool of worker processes, one per core by default, since newspaper's parsing
+    is CPU bound and holds the GIL. Use as `with ArticleParser() as parser:`.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, chunksize: int = 4):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "ArticleParser":
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.executor.shutdown()
+        self.executor = None
+
+    async def parse(self, url: str, html: str) -> Optional[ParsedArticle]:
+        """
+        Parse one page in the pool without blocking the event loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, parse_article_html, url, html)
+
+    def parse_all(self, pages: list[tuple[str, str]]) -> list[Optional[ParsedArticle]]:
+        """
+        Parse (url, html) pairs, returning results in the same order.
+        """
+        if not pages:
+            return []
+        urls, htmls = zip(*pages)
+        return list(self.executor.map(parse_article_html, urls, htmls, chunksize=self.chunksize))
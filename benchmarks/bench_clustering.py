@@ -0,0 +1,134 @@
+"""
+Run article embedding and both clustering stages offline, on a synthetic news corpus embedded with
+HashingEmbeddingBackend. Reports embedding and HDBSCAN times, and how well cluster_into_stories and
+cluster_into_super_stories recover the generated stories and timelines (adjusted Rand index, with
+unclustered items as their own label).
+
+    python -m benchmarks.bench_clustering --stories 200 --articles-per-story 8 --noise 2000 --dims 1024
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import random
+import string
+import time
+
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+
+from cluster import ArticleInfo, cluster_into_stories
+from embedding_backends import HashingEmbeddingBackend
+from embedding_engine import EmbeddingEngine
+from timelines import StoryInfo, cluster_into_super_stories
+
+PROVIDERS = [(f"Provider {i}", country) for i, country in enumerate(["Australia", "UK", "USA", "Canada", "India"] * 4)]
+
+
+def make_words(rng: random.Random, n: int) -> list[str]:
+    return ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10))) for _ in range(n)]
+
+
+def topic_text(rng: random.Random, topic: list[str], common: list[str], words: int) -> str:
+    # Articles on the same topic share most of their distinctive words, padded with common ones
+    return " ".join(rng.choice(topic) if rng.random() < 0.5 else rng.choice(common) for _ in range(words))
+
+
+def synthetic_articles(
+    rng: random.Random, stories: int, per_story: int, noise: int, words: int
+) -> tuple[list[ArticleInfo], list[int]]:
+    common = make_words(rng, 3000)
+    now = dt.datetime.now()
+    articles, labels = [], []
+    for label in list(range(stories)) + [-1] * noise:
+        topic = make_words(rng, 40)
+        for _ in range(per_story if label >= 0 else 1):
+            provider, country = rng.choice(PROVIDERS)
+            title = " ".join(rng.sample(topic, 8))
+            body = topic_text(rng, topic, common, words)
+            ts = now - dt.timedelta(hours=rng.uniform(0, 48))
+            articles.append(ArticleInfo(len(articles), "", ts, title, "", body, provider, country))
+            labels.append(label)
+    return articles, labels
+
+
+def synthetic_stories(rng: random.Random, timelines: int, per_timeline: int, noise: int) -> tuple[list, list[int]]:
+    common = make_words(rng, 3000)
+    now = dt.datetime.now()
+    stories, labels = [], []
+    for label in list(range(timelines)) + [-1] * noise:
+        topic = make_words(rng, 30)
+        for day in range(per_timeline if label >= 0 else 1):
+            ts = now - dt.timedelta(days=day * 13 / max(per_timeline - 1, 1), hours=rng.uniform(0, 12))
+            summary = topic_text(rng, topic, common, 150)
+            stories.append(StoryInfo(len(stories), " ".join(rng.sample(topic, 8)), ts, summary, "", 0))
+            labels.append(label)
+    return stories, labels
+
+
+def cluster_labels(n: int, clusters: list[list], offset: int) -> np.ndarray:
+    """
+    Labels for the clusters found, giving each unclustered item a label of its own.
+    """
+    labels = np.arange(n) + offset
+    for i, members in enumerate(clusters):
+        for member in members:
+            labels[member.id] = i
+    return labels
+
+
+def truth_labels(labels: list[int], offset: int) -> np.ndarray:
+    return np.array([label if label >= 0 else offset + i for i, label in enumerate(labels)])
+
+
+def embed(backend: HashingEmbeddingBackend, texts: list[str]) -> tuple[np.ndarray, float]:
+    engine = EmbeddingEngine(backend)
+    start = time.perf_counter()
+    embeddings = np.asarray(asyncio.run(engine.embed(texts)), dtype=np.float32)
+    return embeddings, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stories", type=int, default=200)
+    parser.add_argument("--articles-per-story", type=int, default=8)
+    parser.add_argument("--noise", type=int, default=2000, help="Articles not in any story.")
+    parser.add_argument("--words", type=int, default=300, help="Words per article body.")
+    parser.add_argument("--timelines", type=int, default=30)
+    parser.add_argument("--stories-per-timeline", type=int, default=8)
+    parser.add_argument("--story-noise", type=int, default=600, help="Stories not in any timeline.")
+    parser.add_argument("--dims", type=int, default=1024)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    backend = HashingEmbeddingBackend(args.dims)
+    print(f"{'stage':>14}{'items':>8}{'embed s':>10}{'cluster s':>11}{'clusters':>10}{'ARI':>8}")
+
+    articles, labels = synthetic_articles(rng, args.stories, args.articles_per_story, args.noise, args.words)
+    texts = [a.title + "\n" + a.subtitle + "\n" + a.body for a in articles]
+    embeddings, embed_seconds = embed(backend, texts)
+    start = time.perf_counter()
+    stories = cluster_into_stories(articles, embeddings)
+    cluster_seconds = time.perf_counter() - start
+    ari = adjusted_rand_score(
+        truth_labels(labels, len(articles)), cluster_labels(len(articles), stories, len(articles))
+    )
+    print(
+        f"{'stories':>14}{len(articles):>8}{embed_seconds:>10.2f}{cluster_seconds:>11.2f}{len(stories):>10}{ari:>8.3f}"
+    )
+
+    story_infos, labels = synthetic_stories(rng, args.timelines, args.stories_per_timeline, args.story_noise)
+    texts = [s.ts.date().isoformat() + "\t" + s.title + "\n" + s.summary for s in story_infos]
+    embeddings, embed_seconds = embed(backend, texts)
+    start = time.perf_counter()
+    super_stories = cluster_into_super_stories(story_infos, embeddings, (0, None))
+    cluster_seconds = time.perf_counter() - start
+    n = len(story_infos)
+    ari = adjusted_rand_score(truth_labels(labels, n), cluster_labels(n, super_stories, n))
+    print(
+        f"{'super stories':>14}{n:>8}{embed_seconds:>10.2f}{cluster_seconds:>11.2f}{len(super_stories):>10}{ari:>8.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Compare article download throughput (articles/min) of the old collector path, one thread per
+provider fetching its articles one after another with a 0.1s pause, against AsyncDownloader with
+global and per-host limits. Each provider is a local stand-in HTTP server on its own port that
+answers after --latency seconds. Downloaded pages are parsed with newspaper unless --no-parse.
+
+    python -m benchmarks.bench_download --providers 8 --articles 50 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from newspaper import Config
+from newspaper.article import Article
+
+from downloader import AsyncDownloader
+
+PARAGRAPH = "<p>" + " ".join(f"word{i}" for i in range(60)) + ".</p>"
+
+
+def article_html(path: str) -> bytes:
+    return f"""<html><head><title>Stand-in article {path} with a long enough title</title>
+<meta property="article:published_time" content="2025-01-01T10:00:00Z"></head>
+<body><article><h1>Stand-in article {path} with a long enough title</h1>{PARAGRAPH * 8}</article></body></html>
+""".encode()
+
+
+def make_handler(latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = article_html(self.path)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_servers(n: int, latency: float) -> list[ThreadingHTTPServer]:
+    servers = []
+    for _ in range(n):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(latency))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def parse(url: str, html: str, config: Config) -> Article:
+    article = Article(url, config=config)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        article.download(input_html=html)
+        article.parse()
+    return article
+
+
+def run_threaded(provider_urls: list[list[str]], config: Config, do_parse: bool) -> int:
+    downloaded = [0] * len(provider_urls)
+
+    def download_provider(i: int, urls: list[str]):
+        session = requests.Session()
+        for url in urls:
+            response = session.get(url, timeout=10)
+            if do_parse:
+                parse(url, response.text, config)
+            downloaded[i] += 1
+            time.sleep(0.1)
+
+    threads = [threading.Thread(target=download_provider, args=(i, urls)) for i, urls in enumerate(provider_urls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(downloaded)
+
+
+async def run_async(provider_urls: list[list[str]], config: Config, do_parse: bool, **downloader_options) -> int:
+    async def download(downloader: AsyncDownloader, url: str) -> bool:
+        result = await downloader.fetch(url)
+        if result.ok and do_parse:
+            await asyncio.to_thread(parse, url, result.text, config)
+        return result.ok
+
+    async with AsyncDownloader(**downloader_options) as downloader:
+        urls = [url for urls in provider_urls for url in urls]
+        return sum(await asyncio.gather(*[download(downloader, url) for url in urls]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--providers", type=int, default=8)
+    parser.add_argument("--articles", type=int, default=50, help="Articles per provider.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Server response delay in seconds.")
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--max-per-host", type=int, default=4)
+    parser.add_argument("--host-delay", type=float, default=0.1)
+    parser.add_argument("--no-parse", action="store_true")
+    args = parser.parse_args()
+
+    servers = start_servers(args.providers, args.latency)
+    provider_urls = [
+        [f"http://127.0.0.1:{server.server_address[1]}/news/article-{i}" for i in range(args.articles)]
+        for server in servers
+    ]
+    config = Config()
+    do_parse = not args.no_parse
+    print(
+        f"{args.providers} providers x {args.articles} articles, latency {args.latency}s, "
+        f"parse={'on' if do_parse else 'off'}"
+    )
+    print(f"{'engine':>10}{'articles':>10}{'seconds':>10}{'articles/min':>15}")
+
+    start = time.perf_counter()
+    n = run_threaded(provider_urls, config, do_parse)
+    elapsed = time.perf_counter() - start
+    print(f"{'threaded':>10}{n:>10}{elapsed:>10.2f}{n / elapsed * 60:>15.0f}")
+
+    start = time.perf_counter()
+    n = asyncio.run(
+        run_async(
+            provider_urls,
+            config,
+            do_parse,
+            max_concurrency=args.max_concurrency,
+            max_per_host=args.max_per_host,
+            host_delay=args.host_delay,
+        )
+    )
+    elapsed = time.perf_counter() - start
+    print(f"{'async':>10}{n:>10}{elapsed:>10.2f}{n / elapsed * 60:>15.0f}")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Compare embedding throughput (texts/s) of the old path, one request and one insert per text, against
+embed_and_write, which sends EmbeddingEngine's batched, concurrent requests and writes each batch as it
+completes. Both talk to a local stand-in for the OpenAI /v1/embeddings endpoint that answers after
+--latency seconds plus --per-text-latency per input, and fails a share --error-rate of requests with a
+429 to exercise retries. Embeddings are written to a scratch table in the db at --config-key.
+
+    python -m benchmarks.bench_embedding --config-key local --texts 500 --latency 0.3 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from db.db_connection import DBHandler
+from db.embedding_codec import encode_embedding
+from embedding import embed_and_write
+from embedding_backends import OpenAIEmbeddingBackend
+from embedding_engine import EmbeddingEngine
+
+BENCH_TABLE = "bench_embeddings"
+SENTENCE = "The council said on Tuesday that the new measures would take effect from the start of next month. "
+
+
+def make_handler(latency: float, per_text_latency: float, error_rate: float, dims: int):
+    rng = random.Random(0)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = request["input"]
+            time.sleep(latency + per_text_latency * len(texts))
+            if rng.random() < error_rate:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}})
+                return
+            vectors = np.random.default_rng(len(texts)).standard_normal((len(texts), dims), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            base64_encoded = request.get("encoding_format") == "base64"
+            data = [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": base64.b64encode(vector.tobytes()).decode() if base64_encoded else vector.tolist(),
+                }
+                for i, vector in enumerate(vectors)
+            ]
+            tokens = sum(len(text) // 4 for text in texts)
+            self._send(
+                200,
+                {
+                    "object": "list",
+                    "data": data,
+                    "model": request["model"],
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                },
+            )
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def reset_table(db: DBHandler):
+    db.run_sql_no_return(f"drop table if exists {BENCH_TABLE}")
+    db.run_sql_no_return(f"create table {BENCH_TABLE} (id int primary key, embedding bytea)")
+
+
+def run_sequential(db: DBHandler, backend: OpenAIEmbeddingBackend, texts: list[str]) -> int:
+    for i, text in enumerate(texts):
+        db.insert_row(BENCH_TABLE, {"id": i, "embedding": encode_embedding(backend.embed([text])[0])})
+    return len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="./config.json")
+    parser.add_argument("--config-key", default="local")
+    parser.add_argument("--texts", type=int, default=500)
+    parser.add_argument("--words", type=int, default=400, help="Words per text.")
+    parser.add_argument("--dims", type=int, default=3072)
+    parser.add_argument("--latency", type=float, default=0.3, help="Server delay per request in seconds.")
+    parser.add_argument("--per-text-latency", type=float, default=0.002, help="Extra server delay per input.")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_handler(args.latency, args.per_text_latency, args.error_rate, args.dims)
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    words = SENTENCE.split()
+    texts = [f"Story {i}\n" + " ".join(words[j % len(words)] for j in range(args.words)) for i in range(args.texts)]
+    print(
+        f"{args.texts} texts of {args.words} words, {args.dims} dims, latency {args.latency}s "
+        f"+ {args.per_text_latency}s per text, error rate {args.error_rate}"
+    )
+    print(f"{'engine':>12}{'texts':>8}{'requests':>10}{'retries':>9}{'seconds':>10}{'texts/s':>10}")
+
+    db = DBHandler(json.load(open(args.config))[args.config_key])
+    try:
+        if not args.skip_sequential:
+            # The old path relies on the client's own retries
+            reset_table(db)
+            start = time.perf_counter()
+            n = run_sequential(db, OpenAIEmbeddingBackend(api_key="stand-in", base_url=base_url), texts)
+            elapsed = time.perf_counter() - start
+            print(f"{'sequential':>12}{n:>8}{n:>10}{'-':>9}{elapsed:>10.2f}{n / elapsed:>10.1f}")
+
+        engine = EmbeddingEngine(
+            OpenAIEmbeddingBackend(api_key="stand-in", base_url=base_url),
+            max_batch_size=args.batch_size,
+            max_concurrency=args.max_concurrency,
+            backoff=0.1,
+        )
+        reset_table(db)
+        start = time.perf_counter()
+        asyncio.run(embed_and_write(db, engine, BENCH_TABLE, "id", dict(enumerate(texts))))
+        elapsed = time.perf_counter() - start
+        n = len(texts)
+        stats = engine.stats
+        print(f"{'batched':>12}{n:>8}{stats['requests']:>10}{stats['retries']:>9}{elapsed:>10.2f}{n / elapsed:>10.1f}")
+    finally:
+        db.run_sql_no_return(f"drop table if exists {BENCH_TABLE}")
+        db.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare loading embeddings stored as text (str(list) parsed with eval) against float32 bytea
+decoded with decode_embeddings: load time, peak Python memory and stored bytes per row.
+Runs offline on synthetic vectors.
+
+    python -m benchmarks.bench_embedding_decode --sizes 10000 100000 --dim 3072
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from db.embedding_codec import decode_embeddings, encode_embedding
+
+POOL_SIZE = 64
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def peak_memory(fn) -> int:
+    # Traced separately from timing, since tracemalloc slows allocation-heavy code a lot
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument(
+        "--max-text-rows",
+        type=int,
+        default=2000,
+        help="The eval path is measured on at most this many rows and extrapolated beyond it.",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pool = [rng.standard_normal(args.dim).tolist() for _ in range(POOL_SIZE)]
+    text_pool = [str(v) for v in pool]
+    blob_pool = [encode_embedding(v) for v in pool]
+    print(f"dim={args.dim}: text {len(text_pool[0]) / 1024:.1f}KB/row, bytea {len(blob_pool[0]) / 1024:.1f}KB/row")
+    print(f"{'rows':>8}{'format':>8}{'load s':>12}{'peak MB':>12}")
+
+    for n in args.sizes:
+        # The input rows are shared references into a small pool, so only the decoded output is counted
+        text_n = min(n, args.max_text_rows)
+        text_rows = [text_pool[i % POOL_SIZE] for i in range(text_n)]
+        elapsed = timed(lambda: [eval(t) for t in text_rows])
+        peak = peak_memory(lambda: [eval(t) for t in text_rows])
+        scale = n / text_n
+        note = "" if text_n == n else f"  (extrapolated from {text_n} rows)"
+        print(f"{n:>8}{'text':>8}{elapsed * scale:>12.2f}{peak * scale / 2**20:>12.0f}{note}")
+
+        blob_rows = [blob_pool[i % POOL_SIZE] for i in range(n)]
+        elapsed = timed(lambda: decode_embeddings(blob_rows))
+        peak = peak_memory(lambda: decode_embeddings(blob_rows))
+        print(f"{n:>8}{'bytea':>8}{elapsed:>12.2f}{peak / 2**20:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
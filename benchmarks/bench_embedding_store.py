@@ -0,0 +1,55 @@
+"""
+Compare loading the clustering windows' embeddings from the db against the local EmbeddingStore:
+a full db load, a first (cold) store sync that copies every stored embedding, and a warm run that
+only syncs new rows and gathers the window from the memory map. Reads the db at --config-key; the
+store is written to a temporary directory.
+
+    python -m benchmarks.bench_embedding_store --config-key railway --dims 3072 --runs 3
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+from cluster import get_article_embeddings
+from db.db_connection import DBHandler
+from embedding_backends import EMBEDDING_DIMS
+from embedding_store import EmbeddingStore
+from timelines import get_story_embeddings
+
+WINDOWS = {"article_embeddings": get_article_embeddings, "story_embeddings": get_story_embeddings}
+
+
+def timed(fn) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config-key", default="railway")
+    parser.add_argument("--dims", type=int, default=EMBEDDING_DIMS)
+    parser.add_argument("--runs", type=int, default=3, help="Warm runs, of which the fastest is reported.")
+    args = parser.parse_args()
+
+    config = json.load(open("./config.json"))
+    db = DBHandler(config[args.config_key])
+    print(f"{'table':>20}{'rows':>8}{'stored':>8}{'MB':>8}{'db s':>8}{'cold s':>8}{'warm s':>8}")
+    with tempfile.TemporaryDirectory() as path:
+        for table, load in WINDOWS.items():
+            db_seconds, (items, embeddings) = timed(lambda: load(db, args.dims))
+            store = EmbeddingStore(table, args.dims, path)
+            cold_seconds, _ = timed(lambda: load(db, args.dims, store))
+            warm = [timed(lambda: load(db, args.dims, store)) for _ in range(args.runs)]
+            warm_seconds = min(seconds for seconds, _ in warm)
+            print(
+                f"{table:>20}{len(items):>8}{len(store):>8}{embeddings.nbytes / 1024**2:>8.1f}"
+                f"{db_seconds:>8.2f}{cold_seconds:>8.2f}{warm_seconds:>8.2f}"
+            )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
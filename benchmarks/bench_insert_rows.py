@@ -0,0 +1,90 @@
+"""
+Compare rows/sec of DBHandler.insert_row against DBHandler.insert_rows (multi-row VALUES and COPY).
+
+    python -m benchmarks.bench_insert_rows --config-key local --rows 20000
+"""
+
+import argparse
+import datetime as dt
+import json
+import random
+import string
+import time
+
+from db.db_connection import DBHandler
+
+BENCH_TABLE = "bench_insert_rows"
+
+
+def make_rows(n: int) -> list[dict]:
+    now = dt.datetime.now(dt.timezone.utc)
+    return [
+        {
+            "ts": now - dt.timedelta(seconds=i),
+            "title": "".join(random.choices(string.ascii_letters + " ", k=80)),
+            "body": "".join(random.choices(string.ascii_letters + " ", k=2000)),
+            "provider_id": i % 30,
+        }
+        for i in range(n)
+    ]
+
+
+def reset_table(db: DBHandler):
+    db.run_sql_no_return(f"drop table if exists {BENCH_TABLE}")
+    db.run_sql_no_return(
+        f"create table {BENCH_TABLE} (id serial primary key, ts timestamp, title text, body text, provider_id int)"
+    )
+
+
+def timed(name: str, n: int, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32}{n:>10} rows{elapsed:>10.2f}s{n / elapsed:>14.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="./config.json")
+    parser.add_argument("--config-key", default="local")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--per-row", type=int, default=2000, help="Rows to insert through the per-row path.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = DBHandler(json.load(open(args.config))[args.config_key])
+    rows = make_rows(args.rows)
+    try:
+        reset_table(db)
+        per_row = rows[: args.per_row]
+        timed("insert_row (one per row)", len(per_row), lambda: [db.insert_row(BENCH_TABLE, r) for r in per_row])
+
+        reset_table(db)
+        timed(
+            "insert_rows VALUES",
+            len(rows),
+            lambda: db.insert_rows(BENCH_TABLE, rows, batch_size=args.batch_size, copy_threshold=len(rows) + 1),
+        )
+
+        reset_table(db)
+        timed(
+            "insert_rows VALUES RETURNING id",
+            len(rows),
+            lambda: db.insert_rows(
+                BENCH_TABLE, rows, returning="id", batch_size=args.batch_size, copy_threshold=len(rows) + 1
+            ),
+        )
+
+        reset_table(db)
+        timed(
+            "insert_rows COPY",
+            len(rows),
+            lambda: db.insert_rows(BENCH_TABLE, rows, batch_size=args.batch_size * 10, copy_threshold=0),
+        )
+    finally:
+        db.run_sql_no_return(f"drop table if exists {BENCH_TABLE}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Parse throughput (pages/s) of newspaper over a corpus of saved html pages, in process and with
+ArticleParser at increasing worker counts. Pass a directory of .html files with --html-dir, or
+a synthetic corpus is generated.
+
+    python -m benchmarks.bench_parse --html-dir saved_pages/ --workers 1 2 4 8
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from article_parser import ArticleParser, parse_article_html
+
+SENTENCE = "The council said on Tuesday that the new measures would take effect from the start of next month. "
+
+
+def synthetic_page(i: int) -> str:
+    paragraphs = "".join(f"<p>{SENTENCE * 4}</p>" for _ in range(30))
+    nav = "".join(f'<li><a href="/section/{j}">Section {j}</a></li>' for j in range(80))
+    images = "".join(f'<img src="/images/{i}-{j}.jpg" width="800" height="450">' for j in range(6))
+    return f"""<html><head><title>Council announces new measures for article number {i}</title>
+<meta property="article:published_time" content="2025-01-01T10:00:00Z">
+<meta name="description" content="Summary of article {i}"></head>
+<body><nav><ul>{nav}</ul></nav><article><h1>Council announces new measures for article number {i}</h1>
+{images}{paragraphs}</article><footer>{nav}</footer></body></html>"""
+
+
+def load_corpus(html_dir: str, n: int) -> list[tuple[str, str]]:
+    if html_dir:
+        paths = sorted(Path(html_dir).glob("*.html"))[:n]
+        return [(f"https://example.com/{p.stem}", p.read_text(errors="replace")) for p in paths]
+    return [(f"https://example.com/news/{i}", synthetic_page(i)) for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--html-dir", default=None)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.html_dir, args.pages)
+    cores = os.cpu_count() or 1
+    workers = args.workers or [w for w in (1, 2, 4, 8, 16, 32) if w <= cores]
+    print(f"{len(pages)} pages, {sum(len(html) for _, html in pages) / len(pages) / 1024:.0f}KB avg, {cores} cores")
+    print(f"{'engine':>14}{'seconds':>10}{'pages/s':>10}")
+
+    start = time.perf_counter()
+    parsed = [parse_article_html(url, html) for url, html in pages]
+    elapsed = time.perf_counter() - start
+    baseline = len(parsed) / elapsed
+    print(f"{'in process':>14}{elapsed:>10.2f}{baseline:>10.1f}")
+
+    for n in workers:
+        with ArticleParser(max_workers=n) as article_parser:
+            # Warm the pool first, so worker start-up isn't counted
+            article_parser.parse_all(pages[:n])
+            start = time.perf_counter()
+            parsed = article_parser.parse_all(pages)
+            elapsed = time.perf_counter() - start
+        rate = len(parsed) / elapsed
+        print(f"{f'{n} workers':>14}{elapsed:>10.2f}{rate:>10.1f}  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
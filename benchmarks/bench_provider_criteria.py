@@ -0,0 +1,101 @@
+"""
+Time check_url, which matches each provider's compiled category regexes, against the old check that
+looped over every category building f-strings, and check both give the same verdict for every url.
+Urls come from a file of tab-separated "provider<TAB>url" lines with --urls-file, else from the
+links in the homepage cache left by collect.py, else a synthetic set built from the criteria table.
+
+    python -m benchmarks.bench_provider_criteria --urls-file homepage_links.tsv --repeat 5
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+from homepage_cache import HOMEPAGE_CACHE_PATH
+from provider_criteria import check_url, provider_criteria
+
+FILLER_SEGMENTS = ["news", "2025", "01", "world", "story", "article", "latest", "uk", "us", "business", "video"]
+
+
+def old_matches_category(url: str, categories: set[str]) -> bool:
+    for category in categories:
+        if f"/{category}/" in url or f"/{category}." in url or f".{category}." in url:
+            return True
+    return False
+
+
+def old_check_url(provider_name: str, url: str) -> bool:
+    criteria = provider_criteria[provider_name]
+    if whitelist := criteria.get("whitelist_categories"):
+        if not old_matches_category(url, whitelist):
+            return False
+    if blacklist := criteria.get("blacklist_categories"):
+        if old_matches_category(url, blacklist):
+            return False
+    return True
+
+
+def synthetic_urls(n: int) -> list[tuple[str, str]]:
+    rng = random.Random(0)
+    providers = sorted(provider_criteria)
+    urls = []
+    for i in range(n):
+        provider_name = rng.choice(providers)
+        categories = [c for lists in provider_criteria[provider_name].values() for c in lists]
+        segments = rng.choices(FILLER_SEGMENTS + categories, k=rng.randint(1, 4))
+        host = rng.choice(["www", "edition"] + categories[:2]) + "." + provider_name.lower().replace(" ", "") + ".com"
+        urls.append((provider_name, f"https://{host}/{'/'.join(segments)}/headline-number-{i}.html"))
+    return urls
+
+
+def load_urls(urls_file: str, n: int) -> tuple[list[tuple[str, str]], str]:
+    if urls_file:
+        with open(urls_file) as f:
+            rows = [tuple(line.rstrip("\n").split("\t", 1)) for line in f if "\t" in line]
+        return [(p, u) for p, u in rows if p in provider_criteria], urls_file
+    if os.path.exists(HOMEPAGE_CACHE_PATH):
+        with open(HOMEPAGE_CACHE_PATH) as f:
+            entries = json.load(f)
+        rows = [
+            (name, url)
+            for name, entry in entries.items()
+            if name in provider_criteria
+            for url in entry["links"] + entry["deferred"]
+        ]
+        if rows:
+            return rows, HOMEPAGE_CACHE_PATH
+    return synthetic_urls(n), "synthetic"
+
+
+def time_check(check, urls: list[tuple[str, str]], repeat: int) -> tuple[float, list[bool]]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        verdicts = [check(provider_name, url) for provider_name, url in urls]
+        best = min(best, time.perf_counter() - start)
+    return best, verdicts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls-file", default=None)
+    parser.add_argument("--urls", type=int, default=200000, help="Size of the synthetic url set")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    urls, source = load_urls(args.urls_file, args.urls)
+    print(f"{len(urls)} urls from {source}, {len({p for p, _ in urls})} providers")
+    print(f"{'check':>10}{'seconds':>10}{'urls/s':>12}{'accepted':>10}")
+    results = {}
+    for name, check in [("old", old_check_url), ("compiled", check_url)]:
+        elapsed, verdicts = time_check(check, urls, args.repeat)
+        results[name] = verdicts
+        print(f"{name:>10}{elapsed:>10.3f}{len(urls) / elapsed:>12.0f}{sum(verdicts):>10}")
+    mismatches = sum(a != b for a, b in zip(results["old"], results["compiled"]))
+    print(f"{mismatches} verdicts differ")
+
+
+if __name__ == "__main__":
+    main()
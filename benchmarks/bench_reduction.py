@@ -0,0 +1,103 @@
+"""
+Compare HDBSCAN on full and reduced embeddings: fit time, clusters found, and agreement (adjusted
+Rand index) with the clusters of the full embeddings, and with the true stories for synthetic data.
+Embeddings are reduced by Matryoshka truncation and by a PCA projection fitted on them.
+
+Real embeddings come from the last 48 hours of article_embeddings with --config-key, or from a saved
+(n, dims) .npy matrix with --embeddings. Otherwise the synthetic corpus of bench_clustering is
+embedded with HashingEmbeddingBackend; hashed features aren't ordered by importance, so truncating
+those is only a lower bound for what truncating text-embedding-3 vectors gives.
+
+    python -m benchmarks.bench_reduction --config-key railway --dims 3072 1024 256
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Optional
+
+import numpy as np
+from hdbscan import HDBSCAN
+from sklearn.metrics import adjusted_rand_score
+
+from benchmarks.bench_clustering import synthetic_articles, truth_labels
+from cluster import get_article_embeddings
+from db.db_connection import DBHandler
+from embedding_backends import HashingEmbeddingBackend
+from embedding_reduction import PcaProjection, truncate_embeddings
+
+
+def load_embeddings(args) -> tuple[np.ndarray, Optional[np.ndarray], str]:
+    if args.config_key:
+        config = json.load(open("./config.json"))
+        db = DBHandler(config[args.config_key])
+        _, embeddings = get_article_embeddings(db, max(args.dims))
+        db.close()
+        return embeddings, None, f"article_embeddings from {args.config_key}"
+    if args.embeddings:
+        return np.load(args.embeddings).astype(np.float32), None, args.embeddings
+    articles, labels = synthetic_articles(random.Random(0), args.stories, 8, args.noise, 300)
+    texts = [a.title + "\n" + a.body for a in articles]
+    embeddings = HashingEmbeddingBackend(max(args.dims)).embed(texts)
+    return embeddings, truth_labels(labels, len(articles)), "synthetic hashed articles"
+
+
+def fit_labels(embeddings: np.ndarray) -> tuple[np.ndarray, float]:
+    # The same settings as cluster_into_stories
+    clusterer = HDBSCAN(min_cluster_size=3, metric="euclidean", cluster_selection_method="eom")
+    start = time.perf_counter()
+    labels = clusterer.fit_predict(embeddings)
+    return labels, time.perf_counter() - start
+
+
+def distinct_noise(labels: np.ndarray) -> np.ndarray:
+    """
+    Give each unclustered item a label of its own, so agreement on noise isn't counted as a cluster.
+    """
+    labels = labels.copy()
+    noise = labels == -1
+    labels[noise] = labels.max() + 1 + np.arange(noise.sum())
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config-key", default=None)
+    parser.add_argument("--embeddings", default=None, help="A saved (n, dims) .npy embedding matrix.")
+    parser.add_argument("--stories", type=int, default=200)
+    parser.add_argument("--noise", type=int, default=2000)
+    parser.add_argument("--dims", type=int, nargs="+", default=[3072, 1024, 256])
+    args = parser.parse_args()
+
+    embeddings, truth, source = load_embeddings(args)
+    full_dims = embeddings.shape[1]
+    print(f"{len(embeddings)} embeddings of {full_dims} dims, {source}")
+    full_labels, _ = fit_labels(embeddings)
+    header = f"{'method':>10}{'dims':>6}{'MB':>8}{'fit s':>8}{'clusters':>10}{'ARI full':>10}"
+    print(header + (f"{'ARI truth':>11}" if truth is not None else ""))
+
+    for dims in sorted(args.dims, reverse=True):
+        if dims > full_dims:
+            continue
+        if dims == full_dims:
+            methods = [("full", embeddings)]
+        else:
+            methods = [
+                ("truncate", truncate_embeddings(embeddings, dims)),
+                ("pca", PcaProjection.fit(embeddings, dims).transform(embeddings)),
+            ]
+        for method, reduced in methods:
+            labels, seconds = fit_labels(reduced)
+            ari_full = adjusted_rand_score(distinct_noise(full_labels), distinct_noise(labels))
+            line = (
+                f"{method:>10}{dims:>6}{reduced.nbytes / 1024**2:>8.1f}{seconds:>8.2f}"
+                f"{labels.max() + 1:>10}{ari_full:>10.3f}"
+            )
+            if truth is not None:
+                line += f"{adjusted_rand_score(truth, distinct_noise(labels)):>11.3f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
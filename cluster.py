@@ -2,7 +2,7 @@ import datetime as dt
 import json
 import re
 from collections import Counter, namedtuple
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import numpy as np
 from hdbscan import HDBSCAN
@@ -12,12 +12,22 @@ from openai import OpenAI
 from openai.types.chat.chat_completion import ChatCompletion
 
 from db.db_connection import DBHandler
+from db.embedding_codec import EMBEDDING_DTYPE, decode_embedding_rows
+from db.keyword_resolver import KeywordResolver
+from db.queries import ARTICLE_EMBEDDINGS_SQL, ARTICLE_WINDOW_SQL, DUPLICATE_ARTICLES_SQL, LATEST_STORY_DIGEST_SQL
 from digest_status import DigestStatus, digest_status_transition
+from embedding_backends import EMBEDDING_DIMS
+from embedding_reduction import embedding_dims
+from embedding_store import EMBEDDING_STORE_DIR, EmbeddingStore
 
 ArticleInfo = namedtuple(
-    "ArticleInfo", ["id", "url", "ts", "title", "subtitle", "body", "provider", "country", "embedding"]
+    "ArticleInfo",
+    ["id", "url", "ts", "title", "subtitle", "body", "provider", "country", "duplicate_of"],
+    defaults=(None,),
 )
 
+ARTICLE_WINDOW = dt.timedelta(hours=48)
+
 STORY_TITLE_AND_SUMMARY_RESPONSE_FORMAT = {
     "type": "json_schema",
     "json_schema": {
@@ -85,7 +95,9 @@ def cluster_criterion(articles: List[ArticleInfo]) -> bool:
 
 def get_story_headline_and_summary(story: List[ArticleInfo], client: OpenAI, retries=0) -> Tuple[str, str, List[str]]:
     response_format = STORY_TITLE_AND_SUMMARY_RESPONSE_FORMAT
-    message_articles = sorted(story, key=article_ranking_key, reverse=True)
+    # Near-duplicates repeat their representative's text, so only representatives are sent
+    message_articles = [a for a in story if a.duplicate_of is None]
+    message_articles = sorted(message_articles, key=article_ranking_key, reverse=True)
     message_articles = message_articles[:20]  # Limit to 20 articles
     messages = [
         STORY_TITLE_AND_SUMMARY_SYSTEM_MESSAGE,
@@ -127,29 +139,52 @@ def get_story_headline_and_summary(story: List[ArticleInfo], client: OpenAI, ret
     return content["headline"], content["story_summary"], content["coverage_summary"], content["keywords"]
 
 
-def get_article_embeddings(db: DBHandler) -> list[ArticleInfo]:
-    sql_out = db.run_sql(
-        f"""
-        select a.id, a.url, a.ts, a.title, a.subtitle, a.body,
-        p.name, p.country, e.embedding
-        from articles a
-        left join article_embeddings e
-        on a.id = e.article_id
-        left join providers p
-        on a.provider_id = p.id
-        where a.ts > '{(dt.datetime.now() - dt.timedelta(hours=48)).strftime("%Y-%m-%d %H:%M:%S")}'
-        and e.embedding is not null
+def get_article_embeddings(
+    db: DBHandler, dims: int = EMBEDDING_DIMS, store: Optional[EmbeddingStore] = None
+) -> tuple[list[ArticleInfo], np.ndarray]:
     """
-    )
-    return [ArticleInfo(a[0], a[1], a[2], a[3], a[4], a[5], a[6], a[7], eval(a[8])) for a in sql_out]
+    Representative articles published, or with a near-duplicate published, in the last 48 hours,
+    and their embeddings. Only embeddings of dims dimensions are read,
+    so rows stored at another size, e.g. before a reduction was configured, are left out.
+    With a store, only the articles are read from the db and the embeddings come from the store.
+    """
+    since = dt.datetime.now() - ARTICLE_WINDOW
+    if store is not None:
+        articles = [
+            ArticleInfo(*a) for a in db.iter_sql(ARTICLE_WINDOW_SQL, (since, since, store.row_bytes), itersize=500)
+        ]
+        return articles, store.synced_rows(db, [a.id for a in articles])
+    sql_out = db.iter_sql(ARTICLE_EMBEDDINGS_SQL, (since, since, dims * EMBEDDING_DTYPE.itemsize), itersize=500)
+    return decode_embedding_rows(sql_out, dims, ArticleInfo)
+
+
+def get_article_duplicates(db: DBHandler, articles: List[ArticleInfo]) -> dict[int, list[ArticleInfo]]:
+    """
+    Near-duplicates of the articles published in the last 48 hours, by representative id.
+    """
+    since = dt.datetime.now() - ARTICLE_WINDOW
+    duplicates: dict[int, list[ArticleInfo]] = {}
+    for a in db.iter_sql(DUPLICATE_ARTICLES_SQL, (since, [a.id for a in articles]), itersize=500):
+        duplicate = ArticleInfo(*a)
+        duplicates.setdefault(duplicate.duplicate_of, []).append(duplicate)
+    return duplicates
 
 
-def cluster_into_stories(articles: List[ArticleInfo]) -> List[List[ArticleInfo]]:
+def cluster_into_stories(
+    articles: List[ArticleInfo], embeddings: np.ndarray, duplicates: Optional[dict[int, list[ArticleInfo]]] = None
+) -> List[List[ArticleInfo]]:
+    """
+    Cluster representative articles, then give each story the near-duplicates of its articles.
+    A representative left unclustered still makes a story if its duplicates meet the criterion.
+    """
+    duplicates = duplicates or {}
     clusterer = HDBSCAN(min_cluster_size=3, metric="euclidean", cluster_selection_method="eom")
-    labels = clusterer.fit_predict([a.embedding for a in articles])
+    labels = clusterer.fit_predict(embeddings)
+    clusters = [[a for a, label in zip(articles, labels) if label == i] for i in range(labels.max() + 1)]
+    clusters += [[a] for a, label in zip(articles, labels) if label == -1 and a.id in duplicates]
     stories: list[list[ArticleInfo]] = []
-    for i in range(len(np.unique(labels))):
-        cluster_articles = [a for a, label in zip(articles, labels) if label == i]
+    for cluster_articles in clusters:
+        cluster_articles = cluster_articles + [d for a in cluster_articles for d in duplicates.get(a.id, [])]
         if cluster_criterion(cluster_articles):
             stories.append(cluster_articles)
     return stories
@@ -175,8 +210,9 @@ def write_story_to_db(
     keywords: list[dict[str, str]],
     digest_id: int,
     digest_description: str,
+    keyword_resolver: KeywordResolver,
 ):
-    db.insert_row(
+    (story_id,) = db.insert_row(
         "stories",
         {
             "ts": dt.datetime.now(),
@@ -186,19 +222,15 @@ def write_story_to_db(
             "digest_id": digest_id,
             "digest_description": digest_description,
         },
+        returning="id",
+    )
+    db.insert_rows("story_articles", [{"story_id": story_id, "article_id": article.id} for article in articles])
+    keyword_ids = keyword_resolver.resolve(keywords)
+    db.insert_rows(
+        "story_keywords",
+        [{"story_id": story_id, "keyword_id": keyword_id} for keyword_id in keyword_ids],
+        on_conflict="do nothing",
     )
-    story_id = db.run_sql("select max(id) from stories")[0][0]
-    for article in articles:
-        db.insert_row("story_articles", {"story_id": story_id, "article_id": article.id})
-    for keyword_dict in keywords:
-        keyword, _type = keyword_dict["keyword"], keyword_dict["type"]
-        keyword_id = db.run_sql("select id from keywords where keyword = %s and type = %s", (keyword, _type))
-        if keyword_id:
-            keyword_id = keyword_id[0][0]
-        else:
-            db.insert_row("keywords", {"keyword": keyword, "type": _type})
-            keyword_id = db.run_sql("select max(id) from keywords")[0][0]
-        db.insert_row("story_keywords", {"story_id": story_id, "keyword_id": keyword_id})
 
 
 def print_story(articles: List[ArticleInfo], headline: str, summary: str, coverage: str, keywords: List[str]):
@@ -223,26 +255,52 @@ def print_stories_breakdown(stories: List[List[ArticleInfo]]):
     expected_status=DigestStatus.ARTICLES_EMBEDDED,
     final_status=DigestStatus.STORIES_GENERATED,
 )
-def cluster_articles(db_config: dict, client: OpenAI, dry_run=False):
-    db = DBHandler(db_config)
-    articles = get_article_embeddings(db)
-    stories = cluster_into_stories(articles)
+def cluster_articles(
+    db: DBHandler,
+    client: OpenAI,
+    dry_run=False,
+    embedding_dims: int = EMBEDDING_DIMS,
+    store_path: Optional[str] = EMBEDDING_STORE_DIR,
+):
+    store = EmbeddingStore("article_embeddings", embedding_dims, store_path) if store_path else None
+    articles, embeddings = get_article_embeddings(db, embedding_dims, store)
+    duplicates = get_article_duplicates(db, articles)
+    print(f"Clustering {len(articles)} articles with {sum(len(d) for d in duplicates.values())} near-duplicates")
+    stories = cluster_into_stories(articles, embeddings, duplicates)
     print_stories_breakdown(stories)
 
     if dry_run:
         print("Dry run, not writing to DB")
         return
-    digest_id = (d if (d := db.run_sql("select max(digest_id) from stories")[0][0]) is not None else -1) + 1
+    digest_id = (d if (d := db.run_sql(LATEST_STORY_DIGEST_SQL)[0][0]) is not None else -1) + 1
     digest_description = dt.date.today().strftime(f"%Y%m%d-{digest_id}")
+    keyword_resolver = KeywordResolver(db)
     for articles in stories:
         headline, story_summary, coverage_summary, keywords = get_story_headline_and_summary(articles, client)
-        write_story_to_db(
-            db, articles, headline, story_summary, coverage_summary, keywords, digest_id, digest_description
-        )
+        with db.transaction():
+            write_story_to_db(
+                db,
+                articles,
+                headline,
+                story_summary,
+                coverage_summary,
+                keywords,
+                digest_id,
+                digest_description,
+                keyword_resolver,
+            )
         print_story(articles, headline, story_summary, coverage_summary, keywords)
 
 
 if __name__ == "__main__":
     config = json.load(open("./config.json"))
+    db = DBHandler(config["railway"], pooled=True, **config.get("db_options", {}))
     client = OpenAI(api_key=config["openai_api_key"])
-    cluster_articles(config["railway"], client, dry_run=False)
+    cluster_articles(
+        db,
+        client,
+        dry_run=False,
+        embedding_dims=embedding_dims(config),
+        store_path=config.get("embedding_store", EMBEDDING_STORE_DIR),
+    )
+    db.close()
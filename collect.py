@@ -1,24 +1,35 @@
+import argparse
+import asyncio
 import datetime as dt
-import io
+import itertools
 import json
+import math
 import re
-import threading
+import resource
 import time
-import warnings
+from collections import Counter
+from contextlib import nullcontext
+from typing import Optional
 from zoneinfo import ZoneInfo
 
-import numpy as np
+import httpx
 import pandas as pd
-import PIL
-import requests
 from newspaper import Config, Source
-from newspaper.article import Article, ArticleDownloadState
-from PIL import Image
 
+from article_parser import ArticleParser, ParsedArticle
+from collect_metrics import CollectMetrics
+from crawl_scheduler import CrawlPlan, CrawlScheduler
+from db.async_db_connection import AsyncDBHandler
 from db.db_connection import DBHandler
 from db.db_objects import ProviderRow
 from digest_status import DigestStatus, add_digest_row, set_digest_status
-from provider_criteria import check_article
+from downloader import AsyncDownloader, FetchResult
+from homepage_cache import HOMEPAGE_CACHE_PATH, HomepageCache, HomepageEntry, body_hash
+from http_archive import HttpArchive, RecordingTransport, ReplayTransport
+from image_check import IMAGE_VERDICTS_PATH, ImageChecker
+from near_duplicates import NearDuplicateIndex
+from provider_criteria import check_url
+from seen_urls import SEEN_URLS_PATH, SeenUrlIndex, canonicalize_url
 
 # as DB table? "Australia", "Australia/Sydney", "AEDT"
 TIMEZONES = {
@@ -36,10 +47,60 @@ TIMEZONES = {
 }
 TIMEZONES: dict[str, ZoneInfo] = {k: ZoneInfo(v) for k, v in TIMEZONES.items()}
 
+RESULT_COLUMNS = [
+    "pulled_from_homepage",
+    "new_links",
+    "accepted_articles",
+    "new_articles",
+    "deferred_links",
+    "downloaded_articles",
+    "parsed_articles",
+    "final",
+    "written",
+    "duplicates",
+]
+
 
 class Collector:
-    def __init__(self, db: DBHandler):
+    def __init__(
+        self,
+        db: DBHandler,
+        max_concurrency: int = 32,
+        max_per_host: int = 4,
+        host_delay: float = 0.1,
+        parse_workers: Optional[int] = None,
+        queue_size: int = 256,
+        write_batch_size: int = 100,
+        write_flush_seconds: float = 2.0,
+        image_workers: int = 16,
+        image_verdicts_path: str = IMAGE_VERDICTS_PATH,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        homepage_cache_path: Optional[str] = HOMEPAGE_CACHE_PATH,
+        dry_run: bool = False,
+        replay: bool = False,
+    ):
         self.db = db
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.host_delay = host_delay
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.write_batch_size = write_batch_size
+        self.write_flush_seconds = write_flush_seconds
+        self.image_workers = image_workers
+        self.image_verdicts_path = image_verdicts_path
+        self.image_stats = {}
+        self.metrics = CollectMetrics()
+        self.transport = transport
+        self.dry_run = dry_run
+        # A replayed archive is crawled as recorded: no url counts as seen, no homepage as cached,
+        # and every provider gets the plan of one without history
+        self.replay = replay
+        self.seen_urls = SeenUrlIndex(None if replay else SEEN_URLS_PATH)
+        self.near_duplicates = NearDuplicateIndex()
+        self._queue_order = itertools.count()
+        self.homepage_cache = HomepageCache(None if replay else homepage_cache_path)
+        self.homepage_stats = dict.fromkeys(["not_modified", "unchanged", "changed", "bytes_saved", "seconds_saved"], 0)
         self.config = Config()
         self.config.allow_binary_content = True  # Allow binary content
         self.config.ignored_content_types_defaults = [
@@ -57,7 +118,6 @@ class Collector:
 
         self.download_counter = 0
         self.write_counter = 0
-        self.image_counter = 0
 
     def _get_providers(self) -> list[ProviderRow]:
         sql_out = self.db.run_sql(
@@ -67,69 +127,20 @@ class Collector:
         )
         return [ProviderRow(*p) for p in sql_out]
 
-    def _get_article_urls(self) -> list[str]:
-        sql_out = self.db.run_sql(
-            """
-        select url from articles
-    """
-        )
-        return [url for url, in sql_out]
-
-    def _build_source(self, provider: ProviderRow, sources):
+    def _build_source(self, provider: ProviderRow, html: str) -> Source:
         source = Source(provider.url, config=self.config)
         source.clean_memo_cache()
-        source.build(only_homepage=True)
-        sources[provider.name] = source
-
-    def _build_sources(self, providers: list[ProviderRow]) -> dict[str, Source]:
-        sources = {}
-        threads: list[threading.Thread] = [
-            threading.Thread(target=self._build_source, args=(p, sources)) for p in providers
-        ]
-        for thread in threads:
-            thread.start()
-        for thread in threads:
-            thread.join()
-        return sources
+        source.build(input_html=html, only_homepage=True)
+        return source
 
     def _format_url(self, url: str) -> str:
-        url = url.split("?")[0]
-        url = url.split("#")[0]
-        return url
-
-    def _format_source_article_urls(self, source: Source):
-        for article in source.articles:
-            article.url = self._format_url(article.url)
-
-    def _download_source_articles(self, source: Source):
-        keep_articles = []
-        for article in source.articles:
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                article.download()
-            if article.download_state == ArticleDownloadState.FAILED_RESPONSE:
-                continue
-            try:
-                article.parse()
-            except Exception:
-                time.sleep(2)
-                article.parse()
-            keep_articles.append(article)
-            self.download_counter += 1
-            print(self.download_counter, end="\r")
-            time.sleep(0.1)
-        source.articles = keep_articles
-
-    def _download_articles(self, sources: dict[str, Source]):
-        threads: list[threading.Thread] = [
-            threading.Thread(target=self._download_source_articles, args=(s,)) for s in sources.values()
-        ]
-        for thread in threads:
-            thread.start()
-        for thread in threads:
-            thread.join()
-
-    def _check_downloaded_article(self, article: Article) -> bool:
+        return canonicalize_url(url)
+
+    def _is_html_response(self, result: FetchResult) -> bool:
+        content_type = result.content_type.split("/")[0].strip().lower()
+        return content_type not in self.config.ignored_content_types_defaults
+
+    def _check_downloaded_article(self, article: ParsedArticle) -> bool:
         if not article.publish_date:
             return False
         if article.publish_date.date() < dt.date.today() - dt.timedelta(days=3):
@@ -140,27 +151,13 @@ class Collector:
             return False
         return True
 
-    @staticmethod
-    def _is_logo_by_colors(image: Image, color_threshold=100):
-        colors = np.unique(np.array(image.convert("RGB")).reshape(-1, 3), axis=0)
-        return len(colors) < color_threshold  # If very few colors, likely a logo
-
-    @staticmethod
-    def _has_transparency(image: Image):
-        if image.mode == "RGBA":
-            return image.getchannel("A").getextrema()[0] < 255  # Alpha channel check
-        return False
-
-    def _article_to_dict(self, provider: ProviderRow, article: Article) -> dict:
+    def _article_to_dict(self, provider: ProviderRow, article: ParsedArticle, image_urls: list[str]) -> dict:
         timezone = TIMEZONES.get(provider.name, TIMEZONES[provider.country])
         date = article.publish_date.date()
         if article.publish_date.time() == dt.time(0, 0):
             ts = article.publish_date.replace(hour=12, tzinfo=timezone).astimezone(ZoneInfo("UTC"))
         else:
             ts = article.publish_date.replace(tzinfo=timezone).astimezone(ZoneInfo("UTC"))
-        image_urls = {self._format_url(url) for url in article.images[:8]}
-        # image_urls = [i for i in image_urls if self._check_image(i)]
-        image_urls = []
         return {
             "provider_id": provider.id,
             "date": date,
@@ -173,108 +170,356 @@ class Collector:
             "image_urls": json.dumps(image_urls),
         }
 
-    def _check_image(self, url: str) -> bool:
+    async def _homepage_links(self, downloader: AsyncDownloader, provider: ProviderRow) -> Optional[list[str]]:
+        """
+        The article links on a provider's homepage, fetched with a conditional GET against the
+        homepage cache. A 304 or an identical body reuses the cached links without parsing.
+        """
+        entry = self.homepage_cache.get(provider.name)
+        result = await downloader.fetch(provider.url, headers=self.homepage_cache.conditional_headers(entry))
+        self.metrics.record_fetch("homepage", provider.name, result)
+        if entry is not None and result.status == 304:
+            self.homepage_stats["not_modified"] += 1
+            self.homepage_stats["bytes_saved"] += entry.bytes
+            self.homepage_stats["seconds_saved"] += entry.parse_seconds
+            return entry.links
+        if not result.ok:
+            print(f"Failed to fetch homepage for {provider.name}: {result.error or result.status}")
+            return None
+        content_hash = body_hash(result.content)
+        if entry is not None and content_hash == entry.body_hash:
+            self.homepage_stats["unchanged"] += 1
+            self.homepage_stats["seconds_saved"] += entry.parse_seconds
+            return entry.links
+        start = time.perf_counter()
         try:
-            self.image_counter += 1
-            print(self.image_counter, end="\r")
-            response = requests.get(url, allow_redirects=True, timeout=3)
-            content_type = response.headers.get("Content-Type", "")
-            if not content_type.startswith("image/"):
-                return False
-            image = Image.open(io.BytesIO(response.content))
-            if image.size[0] < 100 or image.size[1] < 100:
-                return False
-            if self._has_transparency(image):
-                return False
-            if self._is_logo_by_colors(image):
-                return False
-            return True
-        except (requests.RequestException, PIL.UnidentifiedImageError):
-            return False
-
-    def _format_source_articles_for_db(self, provider: ProviderRow, source: Source, formatted_articles: list[dict]):
-        for article in source.articles:
-            formatted_articles.append((provider.name, self._article_to_dict(provider, article)))
-
-    def _format_articles_for_db(self, providers: list[ProviderRow], sources: dict[str, Source]) -> list[dict]:
-        threads: list[threading.Thread] = []
-        formatted_articles = []
-        for provider_name, source in sources.items():
-            provider = next(p for p in providers if p.name == provider_name)
-            threads.append(
-                threading.Thread(
-                    target=self._format_source_articles_for_db, args=(provider, source, formatted_articles)
-                )
+            with self.metrics.timed("source_build", provider.name):
+                source = await asyncio.to_thread(self._build_source, provider, result.text)
+        except Exception as e:
+            print(f"Failed to build source for {provider.name}: {e}")
+            return None
+        links = list(dict.fromkeys(self._format_url(article.url) for article in source.articles))
+        self.homepage_stats["changed"] += 1
+        self.homepage_cache.put(
+            provider.name,
+            HomepageEntry(
+                etag=result.headers.get("etag"),
+                last_modified=result.headers.get("last-modified"),
+                body_hash=content_hash,
+                links=links,
+                bytes=len(result.content),
+                parse_seconds=time.perf_counter() - start,
+            ),
+        )
+        return links
+
+    async def _discover(
+        self, downloader: AsyncDownloader, plan: CrawlPlan, results: dict, download_queue: asyncio.PriorityQueue
+    ):
+        provider = plan.provider
+        entry = self.homepage_cache.get(provider.name)
+        known_links = set(entry.links) - set(entry.deferred) - set(entry.failed) if entry is not None else set()
+        links = await self._homepage_links(downloader, provider)
+        if links is None:
+            return
+        if (entry := self.homepage_cache.get(provider.name)) is not None:
+            entry.failed = []
+        counts = results[provider.name]
+        counts["pulled_from_homepage"] = len(links)
+        deferred = []
+        for url in links:
+            # Links already on the homepage last run were sent downstream then, and reached an outcome
+            if url in known_links:
+                continue
+            counts["new_links"] += 1
+            if not check_url(provider.name, url):
+                continue
+            counts["accepted_articles"] += 1
+            if url in self.seen_urls:
+                continue
+            counts["new_articles"] += 1
+            if plan.link_budget is not None and counts["new_articles"] > plan.link_budget:
+                deferred.append(url)
+                continue
+            await download_queue.put((-plan.priority, next(self._queue_order), provider, url))
+        counts["deferred_links"] = len(deferred)
+        if entry is not None:
+            entry.deferred = deferred
+
+    def _link_failed(self, provider: ProviderRow, url: str):
+        if (entry := self.homepage_cache.get(provider.name)) is not None:
+            entry.failed.append(url)
+
+    async def _download_worker(
+        self,
+        downloader: AsyncDownloader,
+        results: dict,
+        download_queue: asyncio.PriorityQueue,
+        parse_queue: asyncio.Queue,
+    ):
+        while (item := await download_queue.get())[2] is not None:
+            _, _, provider, url = item
+            result = await downloader.fetch(url)
+            self.metrics.record_fetch("download", provider.name, result)
+            if not result.ok:
+                self._link_failed(provider, url)
+            elif self._is_html_response(result):
+                results[provider.name]["downloaded_articles"] += 1
+                self.download_counter += 1
+                print(self.download_counter, end="\r")
+                await parse_queue.put((provider, url, result.text))
+
+    async def _parse_worker(
+        self, parser: ArticleParser, results: dict, parse_queue: asyncio.Queue, image_queue: asyncio.Queue
+    ):
+        while (item := await parse_queue.get()) is not None:
+            provider, url, html = item
+            start = time.perf_counter()
+            article = await parser.parse(url, html)
+            if article is None:
+                self.metrics.record("parse", provider.name, start)
+                self._link_failed(provider, url)
+                continue
+            end = time.perf_counter()
+            self.metrics.record("parse", provider.name, end - article.parse_seconds, end)
+            results[provider.name]["parsed_articles"] += 1
+            if not self._check_downloaded_article(article):
+                continue
+            results[provider.name]["final"] += 1
+            await image_queue.put((provider, article))
+
+    async def _image_worker(self, image_checker: ImageChecker, image_queue: asyncio.Queue, write_queue: asyncio.Queue):
+        while (item := await image_queue.get()) is not None:
+            provider, article = item
+            candidates = list(dict.fromkeys(self._format_url(url) for url in article.images[:8]))
+            with self.metrics.timed("images", provider.name):
+                image_urls = await image_checker.filter(candidates)
+            await write_queue.put((provider, self._article_to_dict(provider, article, image_urls), article.minhash))
+
+    async def _write_articles(
+        self, db: AsyncDBHandler, batch: list[tuple[dict, bytes]]
+    ) -> tuple[list[tuple], dict[int, int]]:
+        """
+        Insert a batch of (row, minhash) articles, skipping urls already stored, and mark the
+        near-duplicates among them. Returns the (id, provider_id) of the inserted rows and the
+        {id: representative id} of the duplicates.
+        """
+        minhashes = {row["url"]: minhash for row, minhash in batch}
+        async with db.transaction():
+            written = await db.insert_rows(
+                "articles",
+                [row for row, _ in batch],
+                on_conflict="on constraint unique_article_url do nothing",
+                returning="id, provider_id, url",
             )
-        for thread in threads:
-            thread.start()
-        for thread in threads:
-            thread.join()
-        return formatted_articles
+            duplicates = await self.near_duplicates.write_articles(
+                db, [(article_id, minhashes[url]) for article_id, _, url in written]
+            )
+        return [(article_id, provider_id) for article_id, provider_id, _ in written], duplicates
+
+    async def _writer(self, db: Optional[AsyncDBHandler], results: dict, write_queue: asyncio.Queue, timings: dict):
+        provider_names = {}
+        done = False
+        while not done:
+            item = await write_queue.get()
+            batch = []
+            # Write once the batch is full, or once nothing new has arrived for write_flush_seconds
+            while item is not None:
+                provider, row, minhash = item
+                provider_names[provider.id] = provider.name
+                batch.append((row, minhash))
+                if len(batch) >= self.write_batch_size:
+                    break
+                try:
+                    item = await asyncio.wait_for(write_queue.get(), self.write_flush_seconds)
+                except asyncio.TimeoutError:
+                    break
+            done = item is None
+            if not batch:
+                continue
+            start = time.perf_counter()
+            if self.dry_run:
+                written, duplicates = [(None, row["provider_id"]) for row, _ in batch], {}
+            else:
+                written, duplicates = await self._write_articles(db, batch)
+                self.seen_urls.add(row["url"] for row, _ in batch)
+            self.metrics.record_write(start, Counter(provider_names[row["provider_id"]] for row, _ in batch))
+            timings.setdefault("first_write", time.perf_counter())
+            for article_id, provider_id in written:
+                results[provider_names[provider_id]]["written"] += 1
+                if article_id in duplicates:
+                    results[provider_names[provider_id]]["duplicates"] += 1
+            self.write_counter += len(written)
+
+    async def _run_pipeline(self, plans: list[CrawlPlan], results: dict, timings: dict):
+        # Links from higher yield providers are downloaded first
+        download_queue = asyncio.PriorityQueue(self.queue_size)
+        parse_queue = asyncio.Queue(self.queue_size)
+        image_queue = asyncio.Queue(self.queue_size)
+        write_queue = asyncio.Queue(self.queue_size)
+        # Batches are written one at a time, so the writer only needs one connection
+        writer_db = nullcontext() if self.dry_run else AsyncDBHandler.from_handler(self.db, max_connections=1)
+        async with AsyncDownloader(
+            headers=self.config.requests_params["headers"],
+            max_concurrency=self.max_concurrency,
+            max_per_host=self.max_per_host,
+            host_delay=self.host_delay,
+            timeout=self.config.requests_params.get("timeout", 10),
+            transport=self.transport,
+        ) as downloader, writer_db as db:
+            image_checker = ImageChecker(downloader, path=self.image_verdicts_path)
+            self.image_stats = image_checker.stats
+            with ArticleParser(self.parse_workers) as parser:
+                # Keep a couple of pages per process in flight so the pool never waits on the queue
+                parse_tasks = parser.max_workers * 2
+                writer = asyncio.create_task(self._writer(db, results, write_queue, timings))
+                parsers = [
+                    asyncio.create_task(self._parse_worker(parser, results, parse_queue, image_queue))
+                    for _ in range(parse_tasks)
+                ]
+                image_checkers = [
+                    asyncio.create_task(self._image_worker(image_checker, image_queue, write_queue))
+                    for _ in range(self.image_workers)
+                ]
+                downloaders = [
+                    asyncio.create_task(self._download_worker(downloader, results, download_queue, parse_queue))
+                    for _ in range(self.max_concurrency)
+                ]
+
+                async def feed():
+                    await asyncio.gather(*[self._discover(downloader, plan, results, download_queue) for plan in plans])
+                    # Each stage is shut down with one None per worker once the stage before it has drained
+                    for _ in downloaders:
+                        await download_queue.put((math.inf, next(self._queue_order), None, None))
+                    await asyncio.gather(*downloaders)
+                    for _ in parsers:
+                        await parse_queue.put(None)
+                    await asyncio.gather(*parsers)
+                    for _ in image_checkers:
+                        await image_queue.put(None)
+                    await asyncio.gather(*image_checkers)
+                    await write_queue.put(None)
+
+                tasks = [asyncio.create_task(feed()), writer, *image_checkers, *parsers, *downloaders]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # A failed stage would leave the others blocked on its queue
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+            if not self.dry_run:
+                image_checker.save()
 
     def collect(self):
         print("Running Collector")
-        results = {}
-        digest_id = add_digest_row(self.db)
+        start = time.perf_counter()
+        self.metrics = CollectMetrics()
+        if not self.dry_run:
+            digest_id = add_digest_row(self.db)
 
         providers = self._get_providers()
         print(f"Pulled {len(providers)} providers")
-        article_urls = self._get_article_urls()
-        print(f"Pulled {len(article_urls)} article urls")
-
-        sources = self._build_sources(providers)
-        for provider, source in sources.items():
-            results[provider] = {"pulled_from_homepage": len(source.articles)}
+        if not self.replay:
+            new_urls = self.seen_urls.sync(self.db)
+            print(f"Synced {new_urls} new article urls, {len(self.seen_urls)} seen")
+        representatives = self.near_duplicates.load(self.db)
+        print(f"Loaded {representatives} recent articles for near-duplicate detection")
+
+        scheduler = CrawlScheduler(self.db)
+        if not self.replay:
+            scheduler.load()
+        plans, skipped = scheduler.plan(providers)
+        if skipped:
+            print(f"Skipping {len(skipped)} low yield providers: {', '.join(p.name for p in skipped)}")
+
+        results = {p.name: dict.fromkeys(RESULT_COLUMNS, 0) for p in providers}
+        timings = {}
+        asyncio.run(self._run_pipeline(plans, results, timings))
+        if not self.dry_run and not self.replay:
+            self.homepage_cache.save()
+            scheduler.record(results, plans, skipped)
+        stats = self.homepage_stats
         print(
-            f"Built {len(sources)} sources, and found {sum(len(source.articles) for source in sources.values())} articles"
+            f"Homepages: {stats['changed']} changed, {stats['not_modified']} not modified, "
+            f"{stats['unchanged']} unchanged; saved {stats['bytes_saved'] / 1024:.0f}KB and "
+            f"{stats['seconds_saved']:.1f}s of parsing"
         )
-
-        for provider, source in sources.items():
-            self._format_source_article_urls(source)
-            source.articles = [article for article in source.articles if check_article(provider, article)]
-            results[provider]["accepted_articles"] = len(source.articles)
-        print(f"Filtered by black/white lists, {sum(len(source.articles) for source in sources.values())} remaining")
-
-        for provider, source in sources.items():
-            source.articles = [article for article in source.articles if article.url not in article_urls]
-            results[provider]["new_articles"] = len(source.articles)
-        print(f"Filtered existing articles, {sum(len(source.articles) for source in sources.values())} remaining")
-
-        print(f"Downloading {sum(len(source.articles) for source in sources.values())} articles")
-        self._download_articles(sources)
-        for provider, source in sources.items():
-            results[provider]["downloaded_articles"] = len(source.articles)
-        print(f"Downloaded {sum(len(source.articles) for source in sources.values())} articles")
-
-        for provider, source in sources.items():
-            source.articles = [article for article in source.articles if self._check_downloaded_article(article)]
-            results[provider]["final"] = len(source.articles)
-        print(f"Keeping {sum([len(source.articles) for source in sources.values()])} articles after article checks")
-
-        print("Formatting for DB and checking images")
-        articles = self._format_articles_for_db(providers, sources)
-
-        print(f"Writing {len(articles)} articles to DB")
-        for provider, article in articles:
-            self.db.insert_row("articles", article)
-            if results[provider].get("written"):
-                results[provider]["written"] += 1
-            else:
-                results[provider]["written"] = 1
-            self.write_counter += 1
-            print(self.write_counter, end="\r")
-        print(f"Wrote {len(articles)} articles")
+        if self.image_stats:
+            print(
+                f"Images: checked {self.image_stats['checked']}, kept {self.image_stats['kept']}, "
+                f"{self.image_stats['cached']} answered from cache, {self.image_stats['bytes'] / 1024:.0f}KB fetched"
+            )
+        if isinstance(self.transport, ReplayTransport):
+            print(f"Replay: {self.transport.hits} requests answered from the archive, {self.transport.misses} missing")
+        totals = {column: sum(counts[column] for counts in results.values()) for column in RESULT_COLUMNS}
+        print(
+            f"Found {totals['pulled_from_homepage']} articles, {totals['new_links']} new on their homepage, "
+            f"{totals['accepted_articles']} passed black/white lists, "
+            f"{totals['new_articles']} new ({totals['deferred_links']} deferred by link budgets), "
+            f"{totals['downloaded_articles']} downloaded, "
+            f"{totals['parsed_articles']} parsed, {totals['final']} passed article checks"
+        )
+        print(
+            f"{'Would have written' if self.dry_run else 'Wrote'} {self.write_counter} articles, "
+            f"{totals['duplicates']} of them near-duplicates"
+        )
+        if "first_write" in timings:
+            print(
+                f"Time to first write {timings['first_write'] - start:.1f}s, total {time.perf_counter() - start:.1f}s"
+            )
+        # ru_maxrss is in KB on Linux; parse workers are counted once the pool has shut down
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        peak_rss_workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        print(f"Peak RSS {peak_rss:.0f}MB, parse workers {peak_rss_workers:.0f}MB")
+
+        timeline = self.metrics.timeline_frame()
+        print("Stage timeline:")
+        for stage, row in timeline.iterrows():
+            print(
+                f"  {stage:<13}{row['spans']:>6.0f} spans, {row['first_start']:>6.1f}s to {row['last_end']:>6.1f}s, "
+                f"{row['busy_seconds']:>7.1f}s busy, p95 {row['p95_seconds']:.2f}s"
+            )
 
         results_df = pd.DataFrame(results).T
-        today = dt.date.today().isoformat()
-        results_df.to_csv(f"results/collection_results_{today}.csv", lineterminator="\n")
-        print(f"Results saved to collection_results_{today}.csv")
-        set_digest_status(self.db, digest_id, DigestStatus.ARTICLES_COLLECTED)
+        results_suffix = f"{dt.date.today().isoformat()}{'_dry_run' if self.dry_run else ''}"
+        results_name = f"collection_results_{results_suffix}.csv"
+        results_df.to_csv(f"results/{results_name}", lineterminator="\n")
+        metrics_name, timeline_name = self.metrics.save(results_suffix)
+        print(f"Results saved to {results_name}, {metrics_name} and {timeline_name}")
+        if not self.dry_run:
+            set_digest_status(self.db, digest_id, DigestStatus.ARTICLES_COLLECTED)
+        if self.db.stats is not None:
+            self.db.stats.print_summary("Query stats for collect")
+            self.db.stats.reset()
         print("Finished Collector")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    archive_mode = parser.add_mutually_exclusive_group()
+    archive_mode.add_argument("--record", metavar="ARCHIVE", help="Save every response fetched into this archive.")
+    archive_mode.add_argument("--replay", metavar="ARCHIVE", help="Answer every request from this archive.")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=None,
+        help="Seconds per replayed response. Defaults to the recorded response times.",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Don't write articles or digest status to the db.")
+    args = parser.parse_args()
+
+    options = {"dry_run": args.dry_run, "replay": bool(args.replay)}
+    if args.record:
+        # Without a persisted homepage cache every homepage is fetched, so the archive has them in full
+        options["transport"] = RecordingTransport(HttpArchive(args.record))
+        options["homepage_cache_path"] = None
+    elif args.replay:
+        options["transport"] = ReplayTransport(HttpArchive(args.replay), args.latency)
+
     config = json.load(open("./config.json"))
-    db = DBHandler(config["railway"])
-    collector = Collector(db)
+    db = DBHandler(config["railway"], pooled=True, **config.get("db_options", {}))
+    collector = Collector(db, **options)
     collector.collect()
+    db.close()
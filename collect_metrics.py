@@ -0,0 +1,125 @@
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from downloader import FetchResult
+
+STAGES = ["homepage", "source_build", "download", "parse", "images", "write"]
+FETCH_STAGES = ["homepage", "download"]
+
+
+@dataclass
+class ProviderMetrics:
+    """
+    Seconds spent on a provider's work in each stage, and the HTTP requests made for its homepage
+    and articles. Time fetches spent waiting on the downloader's limits is counted separately, under
+    "<stage>_wait".
+    """
+
+    seconds: Counter = field(default_factory=Counter)
+    requests: int = 0
+    bytes: int = 0
+    retries: int = 0
+    statuses: Counter = field(default_factory=Counter)
+
+
+class CollectMetrics:
+    """
+    Timings of a collector run. Every timed piece of work is a span of one stage, kept both against
+    its provider and in the run's stage timeline, with times relative to the start of the run.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.providers: dict[str, ProviderMetrics] = defaultdict(ProviderMetrics)
+        self.spans: dict[str, list[tuple[float, float]]] = defaultdict(list)
+
+    def record(self, stage: str, provider_name: Optional[str], start: float, end: Optional[float] = None):
+        """
+        Record a span of a stage from start to end, or to now, as perf_counter times.
+        """
+        end = time.perf_counter() if end is None else end
+        self.spans[stage].append((start - self.start, end - self.start))
+        if provider_name is not None:
+            self.providers[provider_name].seconds[stage] += end - start
+
+    @contextmanager
+    def timed(self, stage: str, provider_name: Optional[str] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, provider_name, start)
+
+    def record_fetch(self, stage: str, provider_name: str, result: FetchResult):
+        """
+        Record a fetch that has just returned, with its bytes, retries and final status. Its span
+        covers only the time spent on requests, not waiting on the downloader's limits.
+        """
+        end = time.perf_counter()
+        self.record(stage, provider_name, end - (result.elapsed - result.waited), end)
+        metrics = self.providers[provider_name]
+        metrics.seconds[f"{stage}_wait"] += result.waited
+        metrics.requests += 1
+        metrics.bytes += result.bytes_downloaded
+        metrics.retries += result.retries
+        metrics.statuses["error" if result.status is None else str(result.status)] += 1
+
+    def record_write(self, start: float, rows_per_provider: Counter):
+        """
+        Record one batch write, splitting its time between providers by their share of the rows.
+        """
+        end = time.perf_counter()
+        self.spans["write"].append((start - self.start, end - self.start))
+        total = sum(rows_per_provider.values())
+        for provider_name, rows in rows_per_provider.items():
+            self.providers[provider_name].seconds["write"] += (end - start) * rows / total
+
+    def provider_frame(self) -> pd.DataFrame:
+        rows = {}
+        for provider_name, metrics in self.providers.items():
+            row = {f"{stage}_seconds": metrics.seconds[stage] for stage in STAGES}
+            row.update({f"{stage}_wait_seconds": metrics.seconds[f"{stage}_wait"] for stage in FETCH_STAGES})
+            row.update(requests=metrics.requests, bytes=metrics.bytes, retries=metrics.retries)
+            row.update({f"status_{status}": count for status, count in metrics.statuses.items()})
+            rows[provider_name] = row
+        frame = pd.DataFrame.from_dict(rows, orient="index")
+        status_columns = sorted(c for c in frame.columns if c.startswith("status_"))
+        frame[status_columns] = frame[status_columns].fillna(0).astype(int)
+        return frame.sort_index()
+
+    def timeline_frame(self) -> pd.DataFrame:
+        """
+        Per stage: how many spans, when the first started and the last ended, the total busy seconds
+        summed over spans, and the median and 95th percentile span.
+        """
+        rows = {}
+        for stage in STAGES + sorted(set(self.spans) - set(STAGES)):
+            if not (spans := self.spans.get(stage)):
+                continue
+            starts, ends = np.array(spans).T
+            durations = ends - starts
+            rows[stage] = {
+                "spans": len(spans),
+                "first_start": starts.min(),
+                "last_end": ends.max(),
+                "busy_seconds": durations.sum(),
+                "median_seconds": np.median(durations),
+                "p95_seconds": np.percentile(durations, 95),
+            }
+        return pd.DataFrame.from_dict(rows, orient="index").round(3)
+
+    def save(self, results_suffix: str) -> tuple[str, str]:
+        """
+        Write the provider metrics and the stage timeline next to the collection results.
+        """
+        metrics_name = f"collection_metrics_{results_suffix}.csv"
+        timeline_name = f"collection_timeline_{results_suffix}.csv"
+        self.provider_frame().round(3).to_csv(f"results/{metrics_name}", lineterminator="\n")
+        self.timeline_frame().to_csv(f"results/{timeline_name}", lineterminator="\n")
+        return metrics_name, timeline_name
@@ -0,0 +1,118 @@
+import datetime as dt
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from db.db_connection import DBHandler
+from db.db_objects import ProviderRow
+
+PROVIDER_YIELDS_SQL = """
+        select provider_id, runs, skipped_runs, new_articles, accepted_articles, kept_articles
+        from provider_yields
+    """
+
+
+@dataclass
+class ProviderYield:
+    """
+    Exponentially weighted averages of a provider's per-run results, and how many runs in a row
+    it has been skipped.
+    """
+
+    provider_id: int
+    runs: int = 0
+    skipped_runs: int = 0
+    new_articles: float = 0.0
+    accepted_articles: float = 0.0
+    kept_articles: float = 0.0
+
+
+@dataclass
+class CrawlPlan:
+    provider: ProviderRow
+    priority: float
+    link_budget: Optional[int]
+
+
+class CrawlScheduler:
+    """
+    Decides from past yields which providers to crawl in a run, in what order, and how many new
+    homepage links to follow for each.
+
+    Providers with fewer than min_runs runs are crawled first, without a link budget. After that,
+    a provider that keeps fewer than skip_below articles per run on average is skipped, but never for
+    more than max_skipped_runs runs in a row, so a source that picks up is noticed. The rest are
+    ordered by average kept articles and follow at most budget_factor times their average number of
+    new articles, and never fewer than min_link_budget.
+    """
+
+    def __init__(
+        self,
+        db: DBHandler,
+        alpha: float = 0.3,
+        min_runs: int = 3,
+        skip_below: float = 0.5,
+        max_skipped_runs: int = 3,
+        budget_factor: float = 2.0,
+        min_link_budget: int = 10,
+    ):
+        self.db = db
+        self.alpha = alpha
+        self.min_runs = min_runs
+        self.skip_below = skip_below
+        self.max_skipped_runs = max_skipped_runs
+        self.budget_factor = budget_factor
+        self.min_link_budget = min_link_budget
+        self.yields: dict[int, ProviderYield] = {}
+
+    def load(self) -> dict[int, ProviderYield]:
+        self.yields = {row[0]: ProviderYield(*row) for row in self.db.run_sql(PROVIDER_YIELDS_SQL)}
+        return self.yields
+
+    def plan(self, providers: list[ProviderRow]) -> tuple[list[CrawlPlan], list[ProviderRow]]:
+        """
+        Returns the crawl plans in priority order, and the providers skipped this run.
+        """
+        plans, skipped = [], []
+        for provider in providers:
+            stats = self.yields.get(provider.id, ProviderYield(provider.id))
+            if stats.runs < self.min_runs:
+                plans.append(CrawlPlan(provider, math.inf, None))
+            elif stats.kept_articles < self.skip_below and stats.skipped_runs < self.max_skipped_runs:
+                skipped.append(provider)
+            else:
+                budget = max(self.min_link_budget, math.ceil(self.budget_factor * stats.new_articles))
+                plans.append(CrawlPlan(provider, stats.kept_articles, budget))
+        plans.sort(key=lambda plan: plan.priority, reverse=True)
+        return plans, skipped
+
+    def _ewma(self, old: float, new: float, runs: int) -> float:
+        return new if runs == 0 else self.alpha * new + (1 - self.alpha) * old
+
+    def record(self, results: dict[str, dict], plans: list[CrawlPlan], skipped: list[ProviderRow]):
+        """
+        Fold a run's results into the yields of the providers crawled, and count the skipped ones.
+        """
+        rows = []
+        for plan in plans:
+            counts = results[plan.provider.name]
+            stats = self.yields.get(plan.provider.id, ProviderYield(plan.provider.id))
+            stats.new_articles = self._ewma(stats.new_articles, counts["new_articles"], stats.runs)
+            stats.accepted_articles = self._ewma(stats.accepted_articles, counts["accepted_articles"], stats.runs)
+            stats.kept_articles = self._ewma(stats.kept_articles, counts["written"], stats.runs)
+            stats.runs += 1
+            stats.skipped_runs = 0
+            rows.append({**vars(stats), "last_crawled": dt.datetime.now()})
+        for provider in skipped:
+            stats = self.yields[provider.id]
+            stats.skipped_runs += 1
+            rows.append({**vars(stats), "last_crawled": None})
+        self.db.insert_rows(
+            "provider_yields",
+            rows,
+            on_conflict="""(provider_id) do update
+                set runs = excluded.runs, skipped_runs = excluded.skipped_runs,
+                new_articles = excluded.new_articles, accepted_articles = excluded.accepted_articles,
+                kept_articles = excluded.kept_articles,
+                last_crawled = coalesce(excluded.last_crawled, provider_yields.last_crawled)""",
+        )
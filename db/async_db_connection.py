@@ -0,0 +1,257 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Optional, Union
+from uuid import uuid4
+
+import psycopg
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+from db.db_connection import DBHandler
+from db.query_stats import QueryStats
+from db.sql_builder import bulk_insert_sql, copy_sql, expand_values, insert_sql
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDBHandler:
+    """
+    asyncio counterpart of DBHandler, on psycopg 3 and its async connection pool, with the same
+    run_sql / run_sql_no_return / iter_sql / insert_row / insert_rows / transaction surface.
+    Statements share their SQL building and QueryStats with DBHandler.
+    Open the pool with `async with AsyncDBHandler(config) as db:` or `await db.open()`.
+
+    Connections run in autocommit mode, so a statement outside a transaction costs one round trip.
+    Each asyncio task gets its own connection for the duration of a statement or transaction.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        min_connections: int = 1,
+        max_connections: int = 8,
+        max_idle_seconds: float = 300.0,
+        query_stats: bool = False,
+        slow_query_seconds: Optional[float] = None,
+    ):
+        # DBHandler configs are psycopg2 connect() kwargs, where libpq's dbname may be given as database
+        conninfo = psycopg.conninfo.make_conninfo(
+            **{("dbname" if k == "database" else k): v for k, v in config.items()}
+        )
+        self.database = config.get("database")
+        self.pool = AsyncConnectionPool(
+            conninfo,
+            min_size=min_connections,
+            max_size=max_connections,
+            max_idle=max_idle_seconds,
+            kwargs={"autocommit": True},
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+        self.stats: Optional[QueryStats] = QueryStats(slow_query_seconds) if query_stats else None
+        self._conn: ContextVar[Optional[AsyncConnection]] = ContextVar(f"conn_{id(self)}", default=None)
+        self._tx_depth: ContextVar[int] = ContextVar(f"tx_depth_{id(self)}", default=0)
+        self._on_commit: ContextVar[Optional[list]] = ContextVar(f"on_commit_{id(self)}", default=None)
+
+    @classmethod
+    def from_handler(cls, db: DBHandler, max_connections: Optional[int] = None) -> "AsyncDBHandler":
+        """
+        An async handler on the database of db, recording into the same QueryStats, for the async
+        stages of a run that otherwise uses db. The pool is sized like db's unless max_connections is given.
+        """
+        handler = cls(
+            db.config,
+            min_connections=1,
+            max_connections=max_connections or db.pool.max_connections,
+            max_idle_seconds=db.pool.max_idle_seconds,
+        )
+        handler.stats = db.stats
+        return handler
+
+    async def open(self):
+        try:
+            await self.pool.open(wait=True)
+            logger.info(f"Connected to db {self.database}")
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __aenter__(self) -> "AsyncDBHandler":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._tx_depth.get() > 0
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[AsyncConnection]:
+        """
+        Check a connection out of the pool for the calling task. Nested calls in the same task reuse
+        the connection that is already checked out.
+        """
+        conn = self._conn.get()
+        if conn is not None:
+            yield conn
+            return
+        async with self.pool.connection() as conn:
+            token = self._conn.set(conn)
+            try:
+                yield conn
+            finally:
+                self._conn.reset(token)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncConnection]:
+        """
+        Group the statements run by this task inside the block into one commit, rolled back if the
+        block raises. Nested blocks become savepoints.
+        """
+        depth = self._tx_depth.get()
+        on_commit_token = self._on_commit.set([]) if depth == 0 else None
+        callbacks = self._on_commit.get()
+        registered = len(callbacks)
+        try:
+            async with self.connection() as conn:
+                token = self._tx_depth.set(depth + 1)
+                try:
+                    async with conn.transaction():
+                        yield conn
+                except BaseException:
+                    del callbacks[registered:]
+                    raise
+                finally:
+                    self._tx_depth.reset(token)
+        finally:
+            if on_commit_token is not None:
+                self._on_commit.reset(on_commit_token)
+        if depth == 0:
+            for callback in callbacks:
+                callback()
+
+    def on_commit(self, callback: Callable[[], None]):
+        """
+        Run callback once the transaction this task is in commits, or right away outside a
+        transaction. Callbacks registered in a block that rolls back, savepoints included, are dropped.
+        """
+        if self.in_transaction:
+            self._on_commit.get().append(callback)
+        else:
+            callback()
+
+    async def run_sql(self, sql: str, vars: Optional[Union[dict, tuple]] = None):
+        try:
+            start = time.perf_counter()
+            async with self.connection() as conn, conn.cursor() as c:
+                await c.execute(sql, vars)
+                out = await c.fetchall()
+            if self.stats is not None:
+                self.stats.record(sql, time.perf_counter() - start, len(out))
+            return out
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+    async def iter_sql(
+        self, sql: str, vars: Optional[Union[dict, tuple]] = None, itersize: int = 2000
+    ) -> AsyncIterator[tuple]:
+        """
+        Stream the rows of a query through a named server-side cursor, fetching itersize rows per
+        round trip. The cursor lives in its own transaction on a connection of its own, not the
+        caller's: the generator is suspended in the caller's context, so it mustn't pin a connection
+        there, and it doesn't see the caller's uncommitted writes.
+        """
+        try:
+            seconds, rows = 0.0, 0
+            async with self.pool.connection() as conn, conn.transaction():
+                async with conn.cursor(name=f"iter_sql_{uuid4().hex}") as c:
+                    start = time.perf_counter()
+                    await c.execute(sql, vars)
+                    while batch := await c.fetchmany(itersize):
+                        seconds += time.perf_counter() - start
+                        rows += len(batch)
+                        for row in batch:
+                            yield row
+                        start = time.perf_counter()
+            if self.stats is not None:
+                self.stats.record(sql, seconds + time.perf_counter() - start, rows)
+        except Exception as e:
+            logger.error(e)
+            raise
+
+    async def run_sql_no_return(self, sql: str, vars: Optional[Union[dict, tuple]] = None, unique_okay=True):
+        start = time.perf_counter()
+        try:
+            # Inside a transaction a duplicate row must only undo this statement, so it runs in a savepoint
+            async with (self.transaction() if self.in_transaction else self.connection()) as conn:
+                async with conn.cursor() as c:
+                    await c.execute(sql, vars)
+                    if self.stats is not None:
+                        self.stats.record(sql, time.perf_counter() - start, c.rowcount)
+        except psycopg.errors.UniqueViolation as e:
+            if unique_okay:
+                logger.warning(e)
+                if self.stats is not None:
+                    self.stats.record(sql, time.perf_counter() - start, 0)
+            else:
+                logger.error(e)
+                raise
+        except Exception as e:
+            logger.error(e)
+            raise
+
+    async def insert_row(self, table: str, row_dict: dict, returning: Optional[str] = None) -> Optional[tuple]:
+        query = insert_sql(table, list(row_dict.keys()), returning)
+        if returning:
+            return (await self.run_sql(query, row_dict))[0]
+        await self.run_sql_no_return(query, row_dict)
+
+    async def insert_rows(
+        self,
+        table: str,
+        row_dicts: list[dict],
+        returning: Optional[str] = None,
+        on_conflict: Optional[str] = None,
+        batch_size: int = 1000,
+        copy_threshold: int = 10000,
+    ) -> Optional[list[tuple]]:
+        """
+        Insert many rows in one transaction, as multi-row VALUES statements of batch_size rows, or
+        with COPY FROM STDIN for copy_threshold rows or more when returning and on_conflict are unset.
+        """
+        if not row_dicts:
+            return [] if returning else None
+        columns = list(row_dicts[0].keys())
+        use_copy = returning is None and on_conflict is None and len(row_dicts) >= copy_threshold
+        start = time.perf_counter()
+        out = [] if returning else None
+        try:
+            async with self.transaction() as conn, conn.cursor() as c:
+                if use_copy:
+                    query = copy_sql(table, columns)
+                    async with c.copy(query) as copy:
+                        for row in row_dicts:
+                            await copy.write_row([row[col] for col in columns])
+                else:
+                    query, _ = bulk_insert_sql(table, columns, on_conflict, returning)
+                    for batch_start in range(0, len(row_dicts), batch_size):
+                        batch_query, params = expand_values(
+                            query, columns, row_dicts[batch_start : batch_start + batch_size]
+                        )
+                        await c.execute(batch_query, params)
+                        if returning:
+                            out.extend(await c.fetchall())
+        except Exception as e:
+            logger.error(e)
+            raise
+        if self.stats is not None:
+            self.stats.record(query, time.perf_counter() - start, len(out) if returning else len(row_dicts))
+        return out
@@ -0,0 +1,111 @@
+"""
+EXPLAIN the stage queries and check that each plan uses the index added for it.
+
+Sequential scans are disabled for the check, since on small tables the planner prefers them
+even when an index applies; what is checked is that each query can use its index at all.
+
+    python -m db.check_query_plans --config-key railway
+"""
+
+import argparse
+import datetime as dt
+import json
+import sys
+
+from db.db_connection import DBHandler
+from db.embedding_codec import EMBEDDING_DTYPE
+from db.queries import (
+    ARTICLE_EMBEDDINGS_SQL,
+    ARTICLE_WINDOW_SQL,
+    DIGEST_STORIES_SQL,
+    DUPLICATE_ARTICLES_SQL,
+    INCOMPLETE_DIGEST_SQL,
+    LATEST_STORY_DIGEST_SQL,
+    RECENT_REPRESENTATIVES_SQL,
+    STORIES_WITHOUT_IMAGES_SQL,
+    STORY_EMBEDDINGS_SQL,
+    STORY_WINDOW_SQL,
+)
+
+# Any size does for the plan; this is a full text-embedding-3-large vector
+EMBEDDING_BYTES = 3072 * EMBEDDING_DTYPE.itemsize
+
+STAGE_QUERY_INDEXES = [
+    (
+        "cluster articles in window",
+        ARTICLE_EMBEDDINGS_SQL,
+        (dt.datetime.now() - dt.timedelta(hours=48),) * 2 + (EMBEDDING_BYTES,),
+        "articles_representative_ts_idx",
+    ),
+    (
+        "cluster articles in window, embeddings from the store",
+        ARTICLE_WINDOW_SQL,
+        (dt.datetime.now() - dt.timedelta(hours=48),) * 2 + (EMBEDDING_BYTES,),
+        "articles_representative_ts_idx",
+    ),
+    (
+        "near-duplicate representatives in window",
+        RECENT_REPRESENTATIVES_SQL,
+        (dt.datetime.now() - dt.timedelta(hours=72),),
+        "articles_representative_ts_idx",
+    ),
+    (
+        "story article duplicates",
+        DUPLICATE_ARTICLES_SQL,
+        (dt.datetime.now() - dt.timedelta(hours=48), [0]),
+        "articles_duplicate_of_idx",
+    ),
+    (
+        "timeline stories in window",
+        STORY_EMBEDDINGS_SQL,
+        (dt.datetime.now() - dt.timedelta(days=14), EMBEDDING_BYTES),
+        "stories_ts_idx",
+    ),
+    (
+        "timeline stories in window, embeddings from the store",
+        STORY_WINDOW_SQL,
+        (dt.datetime.now() - dt.timedelta(days=14), EMBEDDING_BYTES),
+        "stories_ts_idx",
+    ),
+    ("latest story digest", LATEST_STORY_DIGEST_SQL, None, "stories_digest_id_idx"),
+    ("digest stories", DIGEST_STORIES_SQL, (0,), "stories_digest_id_idx"),
+    ("stories without images", STORIES_WITHOUT_IMAGES_SQL, (0,), "images_story_id_idx"),
+    ("incomplete digest", INCOMPLETE_DIGEST_SQL, ("READY",), "digests_ts_idx"),
+    ("article url lookups", "select id from articles where url = %s", ("",), "unique_article_url"),
+]
+
+
+def get_plan_indexes(db: DBHandler, sql: str, vars=None) -> set[str]:
+    with db.connection() as conn:
+        with conn.cursor() as c:
+            c.execute("set local enable_seqscan = off")
+            c.execute("explain (format json) " + sql, vars)
+            plan = c.fetchone()[0][0]["Plan"]
+        conn.rollback()
+    indexes, nodes = set(), [plan]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            indexes.add(node["Index Name"])
+        nodes.extend(node.get("Plans", []))
+    return indexes
+
+
+def check_query_plans(db: DBHandler) -> bool:
+    ok = True
+    for name, sql, vars, expected_index in STAGE_QUERY_INDEXES:
+        indexes = get_plan_indexes(db, sql, vars)
+        passed = expected_index in indexes
+        ok &= passed
+        print(f"{'PASS' if passed else 'FAIL'}\t{name}: expected {expected_index}, plan uses {sorted(indexes)}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config-key", default="railway")
+    args = parser.parse_args()
+    db = DBHandler(json.load(open("./config.json"))[args.config_key])
+    passed = check_query_plans(db)
+    db.close()
+    sys.exit(0 if passed else 1)
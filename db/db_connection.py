@@ -1,15 +1,158 @@
+import io
 import logging
-from typing import Optional, Union
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Union
+from uuid import uuid4
 
 import psycopg2
-from psycopg2.extensions import connection
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection, cursor
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError
+
+from db.query_stats import QueryStats
+from db.sql_builder import bulk_insert_sql, copy_csv_value, copy_sql, insert_sql
 
 logger = logging.getLogger(__name__)
 
 
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections. Checkout blocks until a connection is free,
+    connections are health checked when checked out, and connections left idle for longer
+    than max_idle_seconds are closed and replaced.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        min_connections: int = 1,
+        max_connections: int = 8,
+        max_idle_seconds: float = 300.0,
+        ping_after_seconds: float = 30.0,
+        checkout_timeout: float = 60.0,
+    ):
+        if not 0 <= min_connections <= max_connections or max_connections < 1:
+            raise ValueError(f"Invalid pool size min={min_connections} max={max_connections}")
+        self._config = config
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.max_idle_seconds = max_idle_seconds
+        self.ping_after_seconds = ping_after_seconds
+        self.checkout_timeout = checkout_timeout
+        self.connects = 0
+        self._idle: deque[tuple[connection, float]] = deque()
+        self._checked_out = 0
+        self._cond = threading.Condition()
+        for _ in range(min_connections):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self) -> connection:
+        conn = DBHandler.create_connection(self._config)
+        self.connects += 1
+        return conn
+
+    def _is_healthy(self, conn: connection, last_used: float) -> bool:
+        if conn.closed or conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return False
+        idle_for = time.monotonic() - last_used
+        if idle_for > self.max_idle_seconds:
+            return False
+        if idle_for > self.ping_after_seconds:
+            try:
+                with conn.cursor() as c:
+                    c.execute("select 1")
+                conn.rollback()
+            except psycopg2.Error as e:
+                logger.warning(f"Discarding broken pooled connection: {e}")
+                return False
+        return True
+
+    @staticmethod
+    def _close(conn: connection):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self) -> connection:
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            while not self._idle and self._checked_out >= self.max_connections:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(f"No connection available after {self.checkout_timeout}s")
+                self._cond.wait(remaining)
+            conn, last_used = self._idle.pop() if self._idle else (None, 0.0)
+            self._checked_out += 1
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn: connection, discard: bool = False):
+        if not discard and not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        now = time.monotonic()
+        with self._cond:
+            self._checked_out -= 1
+            if discard or conn.closed:
+                self._close(conn)
+            else:
+                self._idle.append((conn, now))
+            # Recycle connections that have sat idle too long, keeping at least min_connections open
+            while len(self._idle) > self.min_connections and now - self._idle[0][1] > self.max_idle_seconds:
+                self._close(self._idle.popleft()[0])
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.popleft()[0])
+
+
 class DBHandler:
-    def __init__(self, config):
-        self.conn = self.create_connection(config)
+    """
+    Database handler shared by the pipeline stages. By default it holds a single connection, plus
+    a second one while iter_sql streams a result; with pooled=True it checks connections out of a ConnectionPool, so it can be handed to
+    several stages and used from worker threads. Each thread gets its own connection for the
+    duration of a statement.
+    With query_stats=True every statement's latency and row count is recorded in self.stats, and
+    statements slower than slow_query_seconds are logged.
+    """
+
+    def __init__(
+        self,
+        config,
+        pooled: bool = False,
+        min_connections: int = 1,
+        max_connections: int = 8,
+        max_idle_seconds: float = 300.0,
+        query_stats: bool = False,
+        slow_query_seconds: Optional[float] = None,
+    ):
+        self.config = config
+        self.pool = ConnectionPool(
+            config,
+            min_connections=min_connections if pooled else 1,
+            max_connections=max_connections if pooled else 2,
+            max_idle_seconds=max_idle_seconds if pooled else float("inf"),
+        )
+        self._local = threading.local()
+        self.stats: Optional[QueryStats] = QueryStats(slow_query_seconds) if query_stats else None
 
     @staticmethod
     def create_connection(config) -> connection:
@@ -21,58 +164,221 @@ class DBHandler:
             raise e
         return conn
 
+    @contextmanager
+    def connection(self) -> Iterator[connection]:
+        """
+        Check a connection out of the pool for the calling thread. Nested calls on the same
+        thread reuse the connection that is already checked out.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self.pool.getconn()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self.pool.putconn(conn)
+
+    @property
+    def in_transaction(self) -> bool:
+        return getattr(self._local, "tx_depth", 0) > 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[connection]:
+        """
+        Group the statements run on this thread inside the block into one unit of work. They don't
+        commit on their own; the block commits when it exits cleanly and rolls back if it raises.
+        Nested blocks become savepoints, so an inner failure only undoes the inner block.
+        """
+        committed = []
+        with self.connection() as conn:
+            depth = getattr(self._local, "tx_depth", 0)
+            savepoint = f"tx_{depth}" if depth else None
+            if savepoint:
+                with conn.cursor() as c:
+                    c.execute(f"savepoint {savepoint}")
+            else:
+                self._local.on_commit = []
+            callbacks = len(self._local.on_commit)
+            self._local.tx_depth = depth + 1
+            try:
+                yield conn
+            except BaseException:
+                del self._local.on_commit[callbacks:]
+                if savepoint and not conn.closed:
+                    with conn.cursor() as c:
+                        c.execute(f"rollback to savepoint {savepoint}; release savepoint {savepoint}")
+                elif not conn.closed:
+                    conn.rollback()
+                raise
+            else:
+                if savepoint:
+                    with conn.cursor() as c:
+                        c.execute(f"release savepoint {savepoint}")
+                else:
+                    conn.commit()
+                    committed, self._local.on_commit = self._local.on_commit, []
+            finally:
+                self._local.tx_depth = depth
+        for callback in committed:
+            callback()
+
+    def on_commit(self, callback: Callable[[], None]):
+        """
+        Run callback once the transaction this thread is in commits, or right away outside a
+        transaction. Callbacks registered in a block that rolls back, savepoints included, are dropped.
+        """
+        if self.in_transaction:
+            self._local.on_commit.append(callback)
+        else:
+            callback()
+
+    def _commit(self, conn: connection):
+        if not self.in_transaction:
+            conn.commit()
+
+    def close(self):
+        self.pool.closeall()
+
     def run_sql(self, sql: str, vars: Optional[Union[dict, tuple]] = None):
         try:
-            with self.conn.cursor() as c:
-                c = self.conn.cursor()
+            start = time.perf_counter()
+            with self.connection() as conn, conn.cursor() as c:
                 c.execute(sql + ";", vars)
-                self.conn.commit()
+                self._commit(conn)
                 out = c.fetchall()
+            if self.stats is not None:
+                self.stats.record(sql, time.perf_counter() - start, len(out))
             return out
         except Exception as e:
             logger.error(e)
             raise e
 
-    def run_sql_no_return(self, sql: str, vars: Optional[Union[dict, tuple]] = None, unique_okay=True):
+    def iter_sql(self, sql: str, vars: Optional[Union[dict, tuple]] = None, itersize: int = 2000) -> Iterator[tuple]:
+        """
+        Stream the rows of a query through a named server-side cursor, fetching itersize rows per
+        round trip instead of loading the whole result with fetchall(). Outside a transaction the
+        cursor gets a connection of its own, so statements run while iterating don't share it, and
+        the cursor and connection are released as soon as the generator is exhausted or closed.
+        Inside a transaction it reads on the transaction's connection to see its uncommitted writes.
+        """
+        shared = self.in_transaction
+        conn = self._local.conn if shared else self.pool.getconn()
         try:
-            with self.conn.cursor() as c:
-                c = self.conn.cursor()
-                c.execute(";" + sql + ";", vars)
-                self.conn.commit()
-        except psycopg2.errors.UniqueViolation as e:
-            if unique_okay:
-                logger.warning(e)
-                self.conn.rollback()
-            else:
-                logger.error(e)
-                raise
+            # Only time spent in the database is recorded, not time the caller spends between batches
+            seconds, rows = 0.0, 0
+            with conn.cursor(name=f"iter_sql_{uuid4().hex}") as c:
+                start = time.perf_counter()
+                c.execute(sql, vars)
+                while batch := c.fetchmany(itersize):
+                    seconds += time.perf_counter() - start
+                    rows += len(batch)
+                    yield from batch
+                    start = time.perf_counter()
+            if not shared:
+                conn.commit()
+            if self.stats is not None:
+                self.stats.record(sql, seconds + time.perf_counter() - start, rows)
         except Exception as e:
             logger.error(e)
             raise
+        finally:
+            if not shared:
+                self.pool.putconn(conn)
+
+    def run_sql_no_return(self, sql: str, vars: Optional[Union[dict, tuple]] = None, unique_okay=True):
+        # Inside a transaction a duplicate row must only undo this statement, so it runs in a savepoint
+        guard = unique_okay and self.in_transaction
+        start = time.perf_counter()
+        with self.connection() as conn:
+            try:
+                with conn.cursor() as c:
+                    if guard:
+                        c.execute("savepoint unique_okay;" + sql + ";release savepoint unique_okay;", vars)
+                    else:
+                        c.execute(";" + sql + ";", vars)
+                    self._commit(conn)
+                    if self.stats is not None:
+                        self.stats.record(sql, time.perf_counter() - start, c.rowcount)
+            except psycopg2.errors.UniqueViolation as e:
+                if unique_okay:
+                    logger.warning(e)
+                    if guard:
+                        with conn.cursor() as c:
+                            c.execute("rollback to savepoint unique_okay; release savepoint unique_okay")
+                    else:
+                        conn.rollback()
+                    if self.stats is not None:
+                        self.stats.record(sql, time.perf_counter() - start, 0)
+                else:
+                    logger.error(e)
+                    raise
+            except Exception as e:
+                logger.error(e)
+                raise
 
-    def insert_row(self, table: str, row_dict: dict):
-        query = f"""
-            INSERT INTO {table}
-            ({str(list(row_dict.keys())).replace("'", "")[1:-1]})
-            VALUES
-            {"(" + ", ".join(f"%({col})s" for col in row_dict.keys()) + ")"}
+    def insert_row(self, table: str, row_dict: dict, returning: Optional[str] = None) -> Optional[tuple]:
+        """
+        Insert one row. With returning set to a RETURNING column list (e.g. "id"), the returned row
+        is given back, which is the way to get a generated id without a follow-up select.
         """
+        query = insert_sql(table, list(row_dict.keys()), returning)
+        if returning:
+            return self.run_sql(query, row_dict)[0]
         self.run_sql_no_return(query, row_dict)
 
-    # def insert_rows(self, table: str, row_dicts: List[dict]):
-    #     query = f"""
-    #         INSERT INTO {table}
-    #         ({str(list(row_dicts[0].keys())).replace("'", "")[1:-1]})
-    #         VALUES
-    #         {"(" + "), (".join(", ".join(self.adj_value(value) for value in row.values()) for row in row_dicts) + ")"}
-    #     """
-    #     return self.run_sql_no_return(query)
-
-    # def adj_value(self, value):
-    #     if isinstance(value, dt.datetime):
-    #         return value.strftime("TIMESTAMP '%Y-%m-%d %H:%M:%S'")
-    #     if isinstance(value, dt.date):
-    #         return value.strftime("TIMESTAMP '%Y-%m-%d'")
-    #     if isinstance(value, str):
-    #         return "'" + value + "'"
-    #     return str(value)
+    def insert_rows(
+        self,
+        table: str,
+        row_dicts: list[dict],
+        returning: Optional[str] = None,
+        on_conflict: Optional[str] = None,
+        batch_size: int = 1000,
+        copy_threshold: int = 10000,
+    ) -> Optional[list[tuple]]:
+        """
+        Insert many rows, sending one statement per batch_size rows and committing once (or not at all
+        inside a transaction).
+        Inserts smaller than copy_threshold, and any insert using returning or on_conflict, are sent as
+        multi-row VALUES statements; larger ones are streamed with COPY FROM STDIN.
+        returning is a RETURNING column list (e.g. "id"), and one row is returned per inserted row.
+        on_conflict is the clause after ON CONFLICT (e.g. "do nothing").
+        """
+        if not row_dicts:
+            return [] if returning else None
+        columns = list(row_dicts[0].keys())
+        use_copy = returning is None and on_conflict is None and len(row_dicts) >= copy_threshold
+        start = time.perf_counter()
+        with self.connection() as conn:
+            try:
+                with conn.cursor() as c:
+                    if use_copy:
+                        query = self._copy_rows(c, table, columns, row_dicts, batch_size)
+                        out = None
+                    else:
+                        query, template = bulk_insert_sql(table, columns, on_conflict, returning)
+                        out = execute_values(
+                            c, query, row_dicts, template=template, page_size=batch_size, fetch=returning is not None
+                        )
+                    self._commit(conn)
+                if self.stats is not None:
+                    self.stats.record(query, time.perf_counter() - start, len(out) if returning else len(row_dicts))
+            except Exception as e:
+                logger.error(e)
+                raise
+        return out
+
+    @staticmethod
+    def _copy_rows(c: cursor, table: str, columns: list[str], row_dicts: list[dict], batch_size: int) -> str:
+        query = copy_sql(table, columns, csv=True)
+        for start in range(0, len(row_dicts), batch_size):
+            buffer = io.StringIO()
+            for row in row_dicts[start : start + batch_size]:
+                buffer.write(",".join(copy_csv_value(row[col]) for col in columns))
+                buffer.write("\n")
+            buffer.seek(0)
+            c.copy_expert(query, buffer)
+        return query
@@ -1,5 +1,6 @@
 import datetime as dt
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -23,6 +24,7 @@ class ArticleRow:
     image_url: str
     image_urls: str
     date: dt.date
+    duplicate_of: Optional[int] = None
 
 
 @dataclass
@@ -0,0 +1,56 @@
+from typing import Callable, Iterable, Sequence
+
+import numpy as np
+
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+
+def encode_embedding(embedding) -> bytes:
+    """
+    Pack an embedding into little-endian float32 bytes for the bytea embedding columns.
+    """
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def decode_embedding(blob) -> np.ndarray:
+    """
+    Decode one bytea embedding into a float32 vector.
+    """
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE).astype(np.float32)
+
+
+def decode_embeddings(blobs: Sequence) -> np.ndarray:
+    """
+    Decode bytea embeddings straight into one contiguous (n, dim) float32 matrix.
+    """
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+    dim = len(blobs[0]) // EMBEDDING_DTYPE.itemsize
+    matrix = np.empty((len(blobs), dim), dtype=np.float32)
+    for i, blob in enumerate(blobs):
+        if len(blob) != dim * EMBEDDING_DTYPE.itemsize:
+            raise ValueError(f"Embedding {i} has {len(blob) // EMBEDDING_DTYPE.itemsize} dimensions, expected {dim}")
+        matrix[i] = np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+    return matrix
+
+
+def decode_embedding_rows(
+    rows: Iterable[Sequence], dim: int, make: Callable, capacity: int = 1024
+) -> tuple[list, np.ndarray]:
+    """
+    Split streamed rows whose last column is a bytea embedding of dim dimensions into make(*other columns)
+    and one (n, dim) float32 matrix. Each embedding is decoded into the preallocated matrix as its row
+    arrives, doubling it when full, so the raw blobs are never all held at once.
+    """
+    items = []
+    matrix = np.empty((max(capacity, 1), dim), dtype=np.float32)
+    for row in rows:
+        n = len(items)
+        if len(row[-1]) != dim * EMBEDDING_DTYPE.itemsize:
+            raise ValueError(f"Embedding {n} has {len(row[-1]) // EMBEDDING_DTYPE.itemsize} dimensions, expected {dim}")
+        if n == len(matrix):
+            matrix.resize((2 * n, dim), refcheck=False)
+        matrix[n] = np.frombuffer(row[-1], dtype=EMBEDDING_DTYPE)
+        items.append(make(*row[:-1]))
+    matrix.resize((len(items), dim), refcheck=False)
+    return items, matrix
@@ -0,0 +1,52 @@
+import threading
+
+from db.db_connection import DBHandler
+
+
+class KeywordResolver:
+    """
+    Resolves (keyword, type) pairs to keyword ids. Ids are served from an in-process cache warmed
+    from the keywords table, and the keywords missing from it are upserted in one statement.
+    """
+
+    def __init__(self, db: DBHandler):
+        self._db = db
+        self._ids: dict[tuple[str, str], int] = {}
+        self._warmed = False
+        self._lock = threading.Lock()
+
+    def warm(self):
+        ids = {(keyword, _type): i for i, keyword, _type in self._db.iter_sql("select id, keyword, type from keywords")}
+        with self._lock:
+            self._ids.update(ids)
+            self._warmed = True
+
+    def _cache(self, ids: dict[tuple[str, str], int]):
+        with self._lock:
+            self._ids.update(ids)
+
+    def resolve(self, keywords: list[dict[str, str]]) -> list[int]:
+        """
+        Get the ids of a list of {"keyword": ..., "type": ...} dicts, creating keywords that don't
+        exist yet. Duplicates are dropped, otherwise ids are in the order given.
+        """
+        if not self._warmed:
+            self.warm()
+        pairs = list(dict.fromkeys((k["keyword"], k["type"]) for k in keywords))
+        with self._lock:
+            missing = [pair for pair in pairs if pair not in self._ids]
+        if missing:
+            # The no-op update makes RETURNING also give back keywords another writer inserted meanwhile
+            rows = self._db.insert_rows(
+                "keywords",
+                [{"keyword": keyword, "type": _type} for keyword, _type in missing],
+                on_conflict="on constraint unique_keyword do update set keyword = excluded.keyword",
+                returning="id, keyword, type",
+            )
+            resolved = {(keyword, _type): i for i, keyword, _type in rows}
+            # Inside a transaction the new keywords may still be rolled back, so they are only cached once it commits
+            self._db.on_commit(lambda: self._cache(resolved))
+        else:
+            resolved = {}
+        with self._lock:
+            return [resolved[pair] if pair in resolved else self._ids[pair] for pair in pairs]
@@ -0,0 +1,72 @@
+import argparse
+import json
+
+from db.db_connection import DBHandler
+from db.embedding_codec import encode_embedding
+
+EMBEDDING_TABLES = {"article_embeddings": "article_id", "story_embeddings": "story_id"}
+
+
+def get_embedding_column_type(db: DBHandler, table: str) -> str:
+    return db.run_sql(
+        "select data_type from information_schema.columns where table_name = %s and column_name = 'embedding'",
+        (table,),
+    )[0][0]
+
+
+def migrate_embedding_column(db: DBHandler, table: str, key_column: str, batch_size: int = 1000):
+    """
+    Convert a text embedding column holding str(list_of_floats) into a float32 bytea column.
+    Rows are converted in batches into a new column, which then replaces the text column.
+    Safe to rerun: converted rows are skipped, and tables already on bytea are left alone.
+    """
+    if get_embedding_column_type(db, table) == "bytea":
+        print(f"{table}.embedding is already bytea")
+        return
+    db.run_sql_no_return(f"alter table {table} add column if not exists embedding_f32 bytea")
+    rows = db.iter_sql(f"select {key_column}, embedding from {table} where embedding_f32 is null", itersize=batch_size)
+    converted = 0
+    keys, embeddings = [], []
+    for key, embedding in rows:
+        keys.append(key)
+        embeddings.append(encode_embedding(json.loads(embedding)))
+        if len(keys) == batch_size:
+            _write_converted(db, table, key_column, keys, embeddings)
+            converted += len(keys)
+            print(f"{table}: {converted=}", end="\r")
+            keys, embeddings = [], []
+    _write_converted(db, table, key_column, keys, embeddings)
+    converted += len(keys)
+    db.run_sql_no_return(
+        f"""
+        alter table {table} drop column embedding;
+        alter table {table} rename column embedding_f32 to embedding;
+        alter table {table} alter column embedding set not null
+    """
+    )
+    print(f"Converted {converted} rows of {table}.embedding to float32 bytea")
+
+
+def _write_converted(db: DBHandler, table: str, key_column: str, keys: list[int], embeddings: list[bytes]):
+    if not keys:
+        return
+    db.run_sql_no_return(
+        f"""
+        update {table} t
+        set embedding_f32 = v.embedding
+        from unnest(%s::int[], %s::bytea[]) as v(key, embedding)
+        where t.{key_column} = v.key
+    """,
+        (keys, embeddings),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config-key", default="railway")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    db = DBHandler(json.load(open("./config.json"))[args.config_key])
+    for table, key_column in EMBEDDING_TABLES.items():
+        migrate_embedding_column(db, table, key_column, args.batch_size)
+    db.close()
@@ -0,0 +1,337 @@
+import datetime as dt
+from dataclasses import dataclass
+from typing import Callable, Union
+
+from db.db_connection import DBHandler
+from db.migrate_embeddings import EMBEDDING_TABLES, migrate_embedding_column
+
+CREATE_PROVIDERS_TABLE = """
+    create table if not exists providers (
+        id serial not null primary key,
+        name text not null,
+        url text not null,
+        favicon_url text not null,
+        country text not null
+    )
+"""
+
+CREATE_ARTICLES_TABLE = """
+    create table if not exists articles (
+        id serial primary key,
+        ts timestamp,
+        provider_id int not null,
+        title text not null,
+        subtitle text not null,
+        url text not null,
+        body text not null,
+        image_url text,
+        image_urls text,
+        date date,
+        constraint fk_provider_id foreign key (provider_id) references providers(id)
+    )
+"""
+
+CREATE_ARTICLE_EMBEDDINGS_TABLE = """
+    create table if not exists article_embeddings (
+        article_id int not null,
+        embedding bytea not null,
+        constraint fk_article_id foreign key (article_id) references articles(id),
+        primary key (article_id)
+    )
+"""
+
+CREATE_STORIES_TABLE = """
+    create table if not exists stories (
+        id serial primary key,
+        ts timestamp not null,
+        title text not null,
+        summary text not null,
+        coverage text not null,
+        digest_id int not null,
+        digest_description text not null
+    )
+"""
+
+CREATE_STORY_ARTICLES_TABLE = """
+    create table if not exists story_articles (
+        story_id int not null,
+        article_id int not null,
+        constraint fk_story_id foreign key (story_id) references stories(id),
+        constraint fk_article_id foreign key (article_id) references articles(id)
+    )
+"""
+
+CREATE_KEYWORDS_TABLE = """
+    create table if not exists keywords (
+        id serial primary key,
+        keyword text not null,
+        type text not null,
+        constraint unique_keyword unique (keyword, type)
+    )
+"""
+
+CREATE_STORY_KEYWORDS_TABLE = """
+    create table if not exists story_keywords (
+        story_id int not null,
+        keyword_id int not null,
+        constraint fk_story_id foreign key (story_id) references stories(id) on delete cascade,
+        constraint fk_keyword_id foreign key (keyword_id) references keywords(id) on delete cascade,
+        primary key (story_id, keyword_id)
+    )
+"""
+
+CREATE_STORY_EMBEDDINGS_TABLE = """
+    create table if not exists story_embeddings (
+        story_id int not null,
+        embedding bytea not null,
+        constraint fk_story_id foreign key (story_id) references stories(id),
+        primary key (story_id)
+    )
+"""
+
+CREATE_IMAGES_TABLE = """
+    create table if not exists images (
+        id serial primary key,
+        story_id int not null,
+        url text not null,
+        source_page text not null,
+        height int not null,
+        width int not null,
+        format text not null,
+        title text not null,
+        constraint fk_story_id foreign key (story_id) references stories(id)
+    )
+"""
+
+CREATE_DIGESTS_TABLE = """
+    create table if not exists digests (
+        id int primary key,
+        ts timestamp not null,
+        status text not null
+    )
+"""
+
+CREATE_DIGEST_RUNDOWNS_TABLE = """
+    create table if not exists digest_rundowns (
+        digest_id int,
+        rundown_type text,
+        rundown text,
+        primary key (digest_id, rundown_type)
+    )
+"""
+
+CREATE_TIMELINES_TABLE = """
+    create table if not exists timelines (
+        id serial primary key,
+        digest_id int not null,
+        ts timestamp,
+        subject text not null,
+        headline text not null,
+        summary text not null,
+        constraint fk_digest_id foreign key (digest_id) references digests(id),
+        constraint unique_timeline unique (digest_id, subject)
+    )
+"""
+
+CREATE_TIMELINE_EVENTS_TABLE = """
+    create table if not exists timeline_events (
+        timeline_id int not null,
+        story_id int not null,
+        description text not null,
+        date date not null,
+        date_type text not null,
+        constraint fk_timeline_id foreign key (timeline_id) references timelines(id),
+        constraint fk_story_id foreign key (story_id) references stories(id),
+        primary key (timeline_id, description)
+    )
+"""
+
+CREATE_TIMELINE_STORIES_TABLE = """
+    create table if not exists timeline_stories (
+        timeline_id int not null,
+        story_id int not null,
+        constraint fk_timeline_id foreign key (timeline_id) references timelines(id),
+        constraint fk_story_id foreign key (story_id) references stories(id),
+        primary key (timeline_id, story_id)
+    )
+"""
+
+CREATE_TIMELINE_KEYWORDS_TABLE = """
+    create table if not exists timeline_keywords (
+        timeline_id int not null,
+        keyword_id int not null,
+        constraint fk_timeline_id foreign key (timeline_id) references timelines(id),
+        constraint fk_keyword_id foreign key (keyword_id) references keywords(id),
+        primary key (timeline_id, keyword_id)
+    )
+"""
+
+CREATE_STAGE_QUERY_INDEXES = """
+    create index if not exists articles_ts_idx on articles (ts);
+    create index if not exists stories_ts_idx on stories (ts);
+    create index if not exists stories_digest_id_idx on stories (digest_id);
+    create index if not exists images_story_id_idx on images (story_id);
+    create index if not exists digests_ts_idx on digests (ts)
+"""
+
+# Urls were only deduplicated against those loaded when the collector started, so a url can be
+# stored more than once. Each is kept under its lowest id, which references to the others move to.
+ADD_UNIQUE_ARTICLE_URL = """
+    do $$
+    begin
+        if not exists (select 1 from pg_constraint where conname = 'unique_article_url') then
+            create temporary table article_url_duplicates on commit drop as
+                select id, keep_id
+                from (select id, min(id) over (partition by url) as keep_id from articles) a
+                where id <> keep_id;
+
+            insert into story_articles (story_id, article_id)
+                select distinct s.story_id, d.keep_id
+                from story_articles s
+                join article_url_duplicates d on s.article_id = d.id
+                where not exists (
+                    select 1 from story_articles k where k.story_id = s.story_id and k.article_id = d.keep_id
+                );
+            delete from story_articles s using article_url_duplicates d where s.article_id = d.id;
+
+            insert into article_embeddings (article_id, embedding)
+                select distinct on (d.keep_id) d.keep_id, e.embedding
+                from article_url_duplicates d
+                join article_embeddings e on e.article_id = d.id
+                order by d.keep_id, d.id
+                on conflict (article_id) do nothing;
+            delete from article_embeddings e using article_url_duplicates d where e.article_id = d.id;
+
+            delete from articles a using article_url_duplicates d where a.id = d.id;
+            alter table articles add constraint unique_article_url unique (url);
+        end if;
+    end
+    $$
+"""
+
+ADD_UNIQUE_PROVIDER_NAME = """
+    do $$
+    begin
+        if not exists (select 1 from pg_constraint where conname = 'unique_provider_name') then
+            alter table providers add constraint unique_provider_name unique (name);
+        end if;
+    end
+    $$
+"""
+
+ADD_NEAR_DUPLICATES = """
+    alter table articles add column if not exists duplicate_of int references articles(id);
+    create index if not exists articles_duplicate_of_idx on articles (duplicate_of) where duplicate_of is not null;
+    create index if not exists articles_representative_ts_idx on articles (ts) where duplicate_of is null;
+    create table if not exists article_minhashes (
+        article_id int primary key,
+        signature bytea not null,
+        constraint fk_article_id foreign key (article_id) references articles(id)
+    )
+"""
+
+CREATE_PROVIDER_YIELDS_TABLE = """
+    create table if not exists provider_yields (
+        provider_id int primary key,
+        runs int not null,
+        skipped_runs int not null,
+        new_articles real not null,
+        accepted_articles real not null,
+        kept_articles real not null,
+        last_crawled timestamp,
+        constraint fk_provider_id foreign key (provider_id) references providers(id)
+    )
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Union[str, Callable[[DBHandler], None]]
+
+
+def convert_embeddings_to_bytea(db: DBHandler):
+    for table, key_column in EMBEDDING_TABLES.items():
+        migrate_embedding_column(db, table, key_column)
+
+
+# Append new migrations to the end with the next version number; never edit or reorder applied ones.
+# Every migration must be idempotent, so a run interrupted before its version was recorded can be retried.
+MIGRATIONS: list[Migration] = [
+    Migration(
+        1,
+        "create_tables",
+        ";".join(
+            [
+                CREATE_PROVIDERS_TABLE,
+                CREATE_ARTICLES_TABLE,
+                CREATE_ARTICLE_EMBEDDINGS_TABLE,
+                CREATE_STORIES_TABLE,
+                CREATE_STORY_ARTICLES_TABLE,
+                CREATE_KEYWORDS_TABLE,
+                CREATE_STORY_KEYWORDS_TABLE,
+                CREATE_STORY_EMBEDDINGS_TABLE,
+                CREATE_IMAGES_TABLE,
+                CREATE_DIGESTS_TABLE,
+                CREATE_DIGEST_RUNDOWNS_TABLE,
+                CREATE_TIMELINES_TABLE,
+                CREATE_TIMELINE_EVENTS_TABLE,
+                CREATE_TIMELINE_STORIES_TABLE,
+                CREATE_TIMELINE_KEYWORDS_TABLE,
+            ]
+        ),
+    ),
+    Migration(2, "convert_embeddings_to_bytea", convert_embeddings_to_bytea),
+    Migration(3, "create_stage_query_indexes", CREATE_STAGE_QUERY_INDEXES),
+    Migration(4, "add_unique_article_url", ADD_UNIQUE_ARTICLE_URL),
+    Migration(5, "add_unique_provider_name", ADD_UNIQUE_PROVIDER_NAME),
+    Migration(6, "add_near_duplicates", ADD_NEAR_DUPLICATES),
+    Migration(7, "create_provider_yields_table", CREATE_PROVIDER_YIELDS_TABLE),
+]
+
+CREATE_SCHEMA_MIGRATIONS_TABLE = """
+    create table if not exists schema_migrations (
+        version int primary key,
+        name text not null,
+        applied_at timestamp not null
+    )
+"""
+
+
+def get_schema_version(db: DBHandler) -> int:
+    """
+    Get the highest applied migration version, or 0 for a fresh database.
+    """
+    db.run_sql_no_return(CREATE_SCHEMA_MIGRATIONS_TABLE)
+    return db.run_sql("select coalesce(max(version), 0) from schema_migrations")[0][0]
+
+
+def version_row(migration: Migration) -> dict:
+    return {"version": migration.version, "name": migration.name, "applied_at": dt.datetime.now(dt.timezone.utc)}
+
+
+def run_migrations(db: DBHandler, migrations: list[Migration] = MIGRATIONS, verbose: bool = True) -> int:
+    """
+    Apply, in version order, every migration newer than the database's schema version.
+    Returns the number of migrations applied.
+    """
+    versions = [m.version for m in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError(f"Migration versions must be unique and in order, got {versions}")
+    current_version = get_schema_version(db)
+    pending = [m for m in migrations if m.version > current_version]
+    for migration in pending:
+        if verbose:
+            print(f"Applying migration {migration.version} {migration.name}")
+        # SQL migrations are recorded in the same transaction; Python ones manage their own commits
+        if isinstance(migration.apply, str):
+            with db.transaction():
+                db.run_sql_no_return(migration.apply, unique_okay=False)
+                db.insert_row("schema_migrations", version_row(migration))
+        else:
+            migration.apply(db)
+            db.insert_row("schema_migrations", version_row(migration))
+    if verbose:
+        print(f"Schema at version {versions[-1] if versions else current_version}, applied {len(pending)} migrations")
+    return len(pending)
@@ -0,0 +1,128 @@
+"""
+SQL for the pipeline's hot read paths, shared by the stages and db/check_query_plans.py.
+"""
+
+# Representatives in the window, or with a near-duplicate in it: a duplicate is only clustered
+# through its representative, which can be older than the window
+ARTICLE_EMBEDDINGS_SQL = """
+        select a.id, a.url, a.ts, a.title, a.subtitle, a.body,
+        p.name, p.country, e.embedding
+        from articles a
+        left join article_embeddings e
+        on a.id = e.article_id
+        left join providers p
+        on a.provider_id = p.id
+        where a.duplicate_of is null
+        and a.id in (
+            select id from articles where ts > %s and duplicate_of is null
+            union
+            select duplicate_of from articles where ts > %s and duplicate_of is not null
+        )
+        and octet_length(e.embedding) = %s
+    """
+
+ARTICLE_WINDOW_SQL = """
+        select a.id, a.url, a.ts, a.title, a.subtitle, a.body,
+        p.name, p.country
+        from articles a
+        join article_embeddings e
+        on a.id = e.article_id
+        left join providers p
+        on a.provider_id = p.id
+        where a.duplicate_of is null
+        and a.id in (
+            select id from articles where ts > %s and duplicate_of is null
+            union
+            select duplicate_of from articles where ts > %s and duplicate_of is not null
+        )
+        and octet_length(e.embedding) = %s
+        order by a.id
+    """
+
+# Only representatives are kept in the local article embedding store, since only they are clustered
+STORE_ARTICLE_EMBEDDINGS_SQL = """
+        select e.article_id, e.embedding
+        from article_embeddings e
+        join articles a
+        on a.id = e.article_id
+        where a.duplicate_of is null
+        and octet_length(e.embedding) = %s
+        and {condition}
+        order by e.article_id
+    """
+
+DUPLICATE_ARTICLES_SQL = """
+        select a.id, a.url, a.ts, a.title, a.subtitle, a.body,
+        p.name, p.country, a.duplicate_of
+        from articles a
+        left join providers p
+        on a.provider_id = p.id
+        where a.ts > %s
+        and a.duplicate_of = any(%s)
+    """
+
+RECENT_REPRESENTATIVES_SQL = """
+        select m.article_id, m.signature
+        from article_minhashes m
+        join articles a
+        on a.id = m.article_id
+        where a.ts > %s
+        and a.duplicate_of is null
+    """
+
+STORY_EMBEDDINGS_SQL = """
+        select s.id, s.title, s.ts, s.summary, s.coverage, d.id, e.embedding
+        from stories s
+        left join story_embeddings e
+        on s.id = e.story_id
+        left join digests d
+        on s.digest_id = d.id
+        where s.ts > %s
+        and octet_length(e.embedding) = %s
+    """
+
+STORY_WINDOW_SQL = """
+        select s.id, s.title, s.ts, s.summary, s.coverage, d.id
+        from stories s
+        join story_embeddings e
+        on s.id = e.story_id
+        left join digests d
+        on s.digest_id = d.id
+        where s.ts > %s
+        and octet_length(e.embedding) = %s
+        order by s.id
+    """
+
+STORE_STORY_EMBEDDINGS_SQL = """
+        select e.story_id, e.embedding
+        from story_embeddings e
+        where octet_length(e.embedding) = %s
+        and {condition}
+        order by e.story_id
+    """
+
+LATEST_STORY_DIGEST_SQL = """
+        select max(digest_id)
+        from stories
+    """
+
+DIGEST_STORIES_SQL = """
+        select *
+        from stories
+        where digest_id = %s
+    """
+
+STORIES_WITHOUT_IMAGES_SQL = """
+        select s.id, s.title
+        from stories s
+        where not exists (select 1 from images i where i.story_id = s.id)
+        and s.digest_id = %s
+    """
+
+INCOMPLETE_DIGEST_SQL = """
+        select id, status
+        from digests
+        where status != %s
+        order by ts desc
+        limit 1
+    """
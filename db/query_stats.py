@@ -0,0 +1,79 @@
+import functools
+import logging
+import re
+import threading
+from collections import defaultdict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """
+    Reduce a statement to its shape, so calls that only differ in values are counted together.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\s+", " ", sql)
+    sql = re.sub(r"\(\s?\?(?:\s?,\s?\?)*\s?\)(?:\s?,\s?\(\s?\?(?:\s?,\s?\?)*\s?\))+", "(...)", sql)
+    return sql.strip(" ;")
+
+
+class QueryStats:
+    """
+    Per-statement call counts, latencies and row counts for a DBHandler. Statements slower than
+    slow_query_seconds are logged as they happen.
+    """
+
+    def __init__(self, slow_query_seconds: Optional[float] = None):
+        self.slow_query_seconds = slow_query_seconds
+        self._latencies: dict[str, list[float]] = defaultdict(list)
+        self._rows: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, seconds: float, rows: int):
+        statement = normalize_sql(sql)
+        with self._lock:
+            self._latencies[statement].append(seconds)
+            self._rows[statement] += max(rows, 0)
+        if self.slow_query_seconds is not None and seconds > self.slow_query_seconds:
+            logger.warning(f"Slow query ({seconds:.3f}s, {rows} rows): {statement}")
+
+    def reset(self):
+        with self._lock:
+            self._latencies.clear()
+            self._rows.clear()
+
+    def summary(self) -> pd.DataFrame:
+        with self._lock:
+            records = []
+            for statement, latencies in self._latencies.items():
+                latencies_ms = np.array(latencies) * 1000
+                records.append(
+                    {
+                        "statement": statement,
+                        "calls": len(latencies),
+                        "total_s": latencies_ms.sum() / 1000,
+                        "p50_ms": np.percentile(latencies_ms, 50),
+                        "p95_ms": np.percentile(latencies_ms, 95),
+                        "max_ms": latencies_ms.max(),
+                        "rows": self._rows[statement],
+                    }
+                )
+        columns = ["statement", "calls", "total_s", "p50_ms", "p95_ms", "max_ms", "rows"]
+        return pd.DataFrame(records, columns=columns).sort_values("total_s", ascending=False, ignore_index=True)
+
+    def print_summary(self, title: str = "Query stats", statement_width: int = 80):
+        summary = self.summary()
+        print(f"{title}: {summary['calls'].sum()} statements in {summary['total_s'].sum():.2f}s")
+        if summary.empty:
+            return
+        summary["statement"] = summary["statement"].str.slice(0, statement_width)
+        print(summary.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+    def dump(self, path: str):
+        self.summary().to_csv(path, index=False, lineterminator="\n")
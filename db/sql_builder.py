@@ -0,0 +1,69 @@
+"""
+SQL building shared by DBHandler (psycopg2) and AsyncDBHandler (psycopg 3). Both drivers use the
+same %s / %(name)s placeholder style, so the statements are identical.
+"""
+
+import datetime as dt
+from typing import Optional
+
+
+def insert_sql(table: str, columns: list[str], returning: Optional[str] = None) -> str:
+    """
+    Single-row INSERT with %(column)s placeholders.
+    """
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(f'%({col})s' for col in columns)})"
+    if returning:
+        query += f" RETURNING {returning}"
+    return query
+
+
+def bulk_insert_sql(
+    table: str, columns: list[str], on_conflict: Optional[str] = None, returning: Optional[str] = None
+) -> tuple[str, str]:
+    """
+    Multi-row INSERT with a single VALUES %s placeholder, plus the per-row template to fill it with
+    (the form psycopg2's execute_values takes).
+    """
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s"
+    if on_conflict:
+        query += f" ON CONFLICT {on_conflict}"
+    if returning:
+        query += f" RETURNING {returning}"
+    template = "(" + ", ".join(f"%({col})s" for col in columns) + ")"
+    return query, template
+
+
+def expand_values(query: str, columns: list[str], row_dicts: list[dict]) -> tuple[str, list]:
+    """
+    Expand the VALUES %s of a bulk_insert_sql statement into one positional tuple per row, for
+    drivers without execute_values. Returns the statement and its flattened parameters.
+    """
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    values = ", ".join([row_placeholder] * len(row_dicts))
+    params = [row[col] for row in row_dicts for col in columns]
+    return query.replace("VALUES %s", f"VALUES {values}", 1), params
+
+
+def copy_sql(table: str, columns: list[str], csv: bool = False) -> str:
+    query = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    if csv:
+        query += " WITH (FORMAT csv)"
+    return query
+
+
+def copy_csv_value(value) -> str:
+    """
+    Format a value as a COPY csv field. An unquoted empty field is NULL, so every non-null value
+    is quoted.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (dt.date, dt.time)):
+        value = value.isoformat()
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        value = "\\x" + bytes(value).hex()
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
@@ -6,6 +6,7 @@ from openai.types.chat.chat_completion import ChatCompletion
 
 from db.db_connection import DBHandler
 from db.db_objects import DigestRundownRow, StoryRow
+from db.queries import DIGEST_STORIES_SQL
 from digest_status import DigestStatus, digest_status_transition, get_incomplete_digest
 
 RUNDOWN_TYPES = {
@@ -90,7 +91,7 @@ def process_latest_digest(db: DBHandler, openai: OpenAI, dry_run=False):
     print("Processing latest digest")
     latest_digest_id, _ = get_incomplete_digest(db)
     digest_stories: list[StoryRow] = list(
-        map(lambda i: StoryRow(*i), db.run_sql(f"select * from stories where digest_id = {latest_digest_id}"))
+        map(lambda i: StoryRow(*i), db.run_sql(DIGEST_STORIES_SQL, (latest_digest_id,)))
     )
     print(f"Generating rundowns for digest {latest_digest_id} with {len(digest_stories)} stories")
     digest_rundown_rows = generate_rundowns(openai, latest_digest_id, digest_stories)
@@ -99,9 +100,7 @@ def process_latest_digest(db: DBHandler, openai: OpenAI, dry_run=False):
 
     if not dry_run:
         print(f"Inserting {len(digest_rundown_rows)} rows into digest_rundowns")
-        for i, row in enumerate(digest_rundown_rows):
-            print(f"inserting row {i}", end="\r")
-            db.insert_row("digest_rundowns", asdict(row))
+        db.insert_rows("digest_rundowns", [asdict(row) for row in digest_rundown_rows], on_conflict="do nothing")
     else:
         print("Dry run, not inserting rows")
     print("Done processing latest digest")
@@ -109,6 +108,7 @@ def process_latest_digest(db: DBHandler, openai: OpenAI, dry_run=False):
 
 if __name__ == "__main__":
     config = json.load(open("./config.json"))
-    db = DBHandler(config["railway"])
+    db = DBHandler(config["railway"], pooled=True, **config.get("db_options", {}))
     client = OpenAI(api_key=config["openai_api_key"])
     process_latest_digest(db, client, dry_run=False)
+    db.close()
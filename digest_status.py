@@ -1,7 +1,9 @@
 import datetime as dt
+import functools
 from enum import Enum
 
 from db.db_connection import DBHandler
+from db.queries import INCOMPLETE_DIGEST_SQL
 
 
 class DigestStatus(Enum):
@@ -54,9 +56,7 @@ def get_incomplete_digest(db: DBHandler) -> tuple[int, DigestStatus]:
     """
     Get the ID and status of the most recent incomplete digest.
     """
-    incomplete_digest = db.run_sql(
-        "select id, status from digests where status != %s order by ts desc limit 1", (DigestStatus.READY.value,)
-    )
+    incomplete_digest = db.run_sql(INCOMPLETE_DIGEST_SQL, (DigestStatus.READY.value,))
     if not incomplete_digest:
         raise ValueError("No incomplete digest found.")
     return incomplete_digest[0][0], DigestStatus(incomplete_digest[0][1])
@@ -65,20 +65,29 @@ def get_incomplete_digest(db: DBHandler) -> tuple[int, DigestStatus]:
 def digest_status_transition(expected_status: DigestStatus, final_status: DigestStatus):
     """
     Decorator to ensure the digest has the expected status before running the function,
-    and to set the digest to the final status after the function cåompletes.
+    and to set the digest to the final status after the function completes.
+    The wrapped function is always called with a DBHandler. When given a config dict, one pooled
+    DBHandler is opened, shared by the status checks and the function, and closed afterwards.
+    If the handler records query stats, they are printed and reset when the stage finishes.
     """
 
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(db_config_or_db: dict | DBHandler, *args, **kwargs):
-            if isinstance(db_config_or_db, dict):
-                db = DBHandler(db_config_or_db)
-            else:
-                db = db_config_or_db
-            digest_id, current_status = get_incomplete_digest(db)
-            if current_status != expected_status:
-                raise ValueError(f"Digest {digest_id} is in status {current_status}, expected {expected_status}.")
-            result = func(db_config_or_db, *args, **kwargs)
-            set_digest_status(db, digest_id, final_status)
+            owns_db = isinstance(db_config_or_db, dict)
+            db = DBHandler(db_config_or_db, pooled=True) if owns_db else db_config_or_db
+            try:
+                digest_id, current_status = get_incomplete_digest(db)
+                if current_status != expected_status:
+                    raise ValueError(f"Digest {digest_id} is in status {current_status}, expected {expected_status}.")
+                result = func(db, *args, **kwargs)
+                set_digest_status(db, digest_id, final_status)
+                if db.stats is not None:
+                    db.stats.print_summary(f"Query stats for {func.__name__}")
+                    db.stats.reset()
+            finally:
+                if owns_db:
+                    db.close()
             return result
 
         return wrapper
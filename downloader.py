@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: Optional[int] = None
+    content: bytes = b""
+    text: str = ""
+    headers: dict[str, str] = field(default_factory=dict)
+    retries: int = 0
+    elapsed: float = 0.0
+    # Part of elapsed spent waiting for a free slot, the host's turn or a retry backoff
+    waited: float = 0.0
+    # Bytes received over the wire for every attempt, before decompression
+    bytes_downloaded: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status is not None and 200 <= self.status < 300
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("content-type", "")
+
+
+class AsyncDownloader:
+    """
+    Concurrent HTTP client for the collector. Requests are capped globally by max_concurrency and
+    per host by max_per_host, and request starts to the same host are spaced by host_delay seconds.
+    Connections are kept alive per host. Timeouts, connection errors and retryable statuses are
+    retried up to retries times with exponential backoff.
+    Use as `async with AsyncDownloader(...) as downloader:`.
+    """
+
+    def __init__(
+        self,
+        headers: Optional[dict] = None,
+        max_concurrency: int = 32,
+        max_per_host: int = 4,
+        host_delay: float = 0.1,
+        timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.headers = headers or {}
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.host_delay = host_delay
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._global_slots: Optional[asyncio.Semaphore] = None
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+        self._host_locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._host_next_start: dict[str, float] = defaultdict(float)
+
+    async def __aenter__(self) -> "AsyncDownloader":
+        self._client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            follow_redirects=True,
+            transport=self.transport,
+        )
+        self._global_slots = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._client.aclose()
+        self._client = None
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    async def _wait_for_host_turn(self, host: str) -> float:
+        async with self._host_locks[host]:
+            now = time.monotonic()
+            start = max(now, self._host_next_start[host])
+            self._host_next_start[host] = start + self.host_delay
+        if start > now:
+            await asyncio.sleep(start - now)
+        return start - now
+
+    async def fetch(self, url: str, headers: Optional[dict] = None) -> FetchResult:
+        """
+        GET a url, never raising: failures are reported in FetchResult.error.
+        """
+        host = self.host(url)
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        result = FetchResult(url=url)
+        start = time.monotonic()
+        async with self._host_slots[host], self._global_slots:
+            result.waited = time.monotonic() - start
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    result.retries += 1
+                    result.waited += self.backoff * 2 ** (attempt - 1)
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                result.waited += await self._wait_for_host_turn(host)
+                try:
+                    response = await self._client.get(url, headers=headers)
+                except httpx.HTTPError as e:
+                    result.status = None
+                    result.error = f"{type(e).__name__}: {e}"
+                    continue
+                result.status = response.status_code
+                result.bytes_downloaded += response.num_bytes_downloaded
+                result.headers = {k.lower(): v for k, v in response.headers.items()}
+                result.error = None
+                if response.status_code in RETRY_STATUSES:
+                    continue
+                result.content = response.content
+                result.text = response.text
+                break
+        result.elapsed = time.monotonic() - start
+        return result
+
+    async def fetch_all(self, urls: list[str], headers: Optional[dict] = None) -> list[FetchResult]:
+        return await asyncio.gather(*[self.fetch(url, headers) for url in urls])
@@ -1,31 +1,124 @@
 import argparse
+import asyncio
 import json
+from typing import Optional
 
-from openai import OpenAI
+import numpy as np
 
+from db.async_db_connection import AsyncDBHandler
 from db.db_connection import DBHandler
 from db.db_objects import ArticleRow, StoryRow
+from db.embedding_codec import encode_embedding
 from digest_status import DigestStatus, digest_status_transition
+from embedding_backends import backend_from_config
+from embedding_cache import EmbeddingCache
+from embedding_engine import EmbeddingEngine
+from embedding_reduction import PcaProjection, projection_from_config
+
+INHERIT_DUPLICATE_EMBEDDINGS_SQL = """
+        insert into article_embeddings (article_id, embedding)
+        select a.id, e.embedding
+        from articles a
+        join article_embeddings e
+        on e.article_id = a.duplicate_of
+        where not exists (select 1 from article_embeddings d where d.article_id = a.id)
+        on conflict do nothing
+    """
+
+
+def article_embedding_text(article: ArticleRow) -> str:
+    return article.title + "\n" + article.subtitle + "\n" + " ".join(article.body.split()[:800])
 
 
-def get_embedding(text, client: OpenAI, model="text-embedding-3-large"):
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+def story_embedding_text(story: StoryRow) -> str:
+    return story.ts.date().isoformat() + "\t" + story.title + "\n" + story.summary
+
+
+async def embed_and_write(
+    db: DBHandler,
+    engine: EmbeddingEngine,
+    table: str,
+    key_column: str,
+    texts: dict[int, str],
+    cache: Optional[EmbeddingCache] = None,
+    projection: Optional[PcaProjection] = None,
+):
+    """
+    Embed {id: text} with the engine, writing each batch to table as it completes. Texts found in
+    the cache are written without a request, and each distinct text is only sent once. With a
+    projection, embeddings are cached as the backend returns them and stored projected.
+    Rows are written through an AsyncDBHandler on db's database, one batch at a time.
+    """
+    async with AsyncDBHandler.from_handler(db, max_connections=1) as async_db:
+        await _embed_and_write(async_db, engine, table, key_column, texts, cache, projection)
 
 
-def get_article_embedding(article: ArticleRow, client: OpenAI):
-    return get_embedding(article.title + "\n" + article.subtitle + "\n" + " ".join(article.body.split()[:800]), client)
+async def _embed_and_write(
+    db: AsyncDBHandler,
+    engine: EmbeddingEngine,
+    table: str,
+    key_column: str,
+    texts: dict[int, str],
+    cache: Optional[EmbeddingCache],
+    projection: Optional[PcaProjection],
+):
+    reduce = projection.transform if projection is not None else np.asarray
+    to_embed: dict[str, list[int]] = {}
+    cached = cache.get_many(engine.model, list(texts.values())) if cache is not None else [None] * len(texts)
+    cached_keys, cached_embeddings = [], []
+    for (key, text), embedding in zip(texts.items(), cached):
+        if embedding is not None:
+            cached_keys.append(key)
+            cached_embeddings.append(embedding)
+        else:
+            to_embed.setdefault(text, []).append(key)
+    cached_rows = []
+    if cached_keys:
+        cached_rows = [
+            {key_column: key, "embedding": encode_embedding(e)}
+            for key, e in zip(cached_keys, reduce(np.array(cached_embeddings)))
+        ]
+    await db.insert_rows(table, cached_rows, on_conflict="do nothing")
+    unique_texts = list(to_embed.keys())
+    embedded = 0
+    async for indices, embeddings in engine.embed_batches(unique_texts):
+        batch_texts = [unique_texts[i] for i in indices]
+        if cache is not None:
+            cache.put_many(engine.model, batch_texts, embeddings)
+        rows = [
+            {key_column: key, "embedding": encode_embedding(e)}
+            for text, e in zip(batch_texts, reduce(np.asarray(embeddings, dtype=np.float32)))
+            for key in to_embed[text]
+        ]
+        await db.insert_rows(table, rows, on_conflict="do nothing")
+        embedded += len(rows)
+        print(f"{embedded=}", end="\r")
+    stats = engine.stats
+    print(
+        f"Wrote {len(cached_rows)} cached embeddings, embedded {stats['texts']} texts in {stats['requests']} requests, "
+        f"{stats['retries']} retried"
+    )
+    if cache is not None:
+        print(cache.summary())
 
 
-def get_story_embedding(story: StoryRow, client: OpenAI):
-    return get_embedding(story.ts.date().isoformat() + "\t" + story.title + "\n" + story.summary, client)
+def inherit_duplicate_embeddings(db: DBHandler):
+    """
+    Give near-duplicate articles their representative's embedding instead of embedding them again.
+    """
+    db.run_sql_no_return(INHERIT_DUPLICATE_EMBEDDINGS_SQL)
 
 
 @digest_status_transition(
     expected_status=DigestStatus.ARTICLES_COLLECTED,
     final_status=DigestStatus.ARTICLES_EMBEDDED,
 )
-def embed_articles(db_config: dict, client: OpenAI):
-    db = DBHandler(db_config)
+def embed_articles(
+    db: DBHandler,
+    engine: EmbeddingEngine,
+    cache: Optional[EmbeddingCache] = None,
+    projection: Optional[PcaProjection] = None,
+):
     sql_out = db.run_sql(
         """
         select a.*
@@ -33,24 +126,26 @@ def embed_articles(db_config: dict, client: OpenAI):
         left outer join article_embeddings e
         on a.id = e.article_id
         where e.article_id is null
+        and a.duplicate_of is null
     """
     )
     unembedded_articles = [ArticleRow(*a) for a in sql_out]
-    embedded = 0
     print(f"Embedding {len(unembedded_articles)} articles")
-    for article in unembedded_articles:
-        embedding = get_article_embedding(article, client)
-        embedded += 1
-        print(f"{embedded=}", end="\r")
-        db.insert_row("article_embeddings", {"article_id": article.id, "embedding": str(embedding)})
+    texts = {article.id: article_embedding_text(article) for article in unembedded_articles}
+    asyncio.run(embed_and_write(db, engine, "article_embeddings", "article_id", texts, cache, projection))
+    inherit_duplicate_embeddings(db)
 
 
 @digest_status_transition(
     expected_status=DigestStatus.STORIES_GENERATED,
     final_status=DigestStatus.STORIES_EMBEDDED,
 )
-def embed_stories(db_config: dict, client: OpenAI):
-    db = DBHandler(db_config)
+def embed_stories(
+    db: DBHandler,
+    engine: EmbeddingEngine,
+    cache: Optional[EmbeddingCache] = None,
+    projection: Optional[PcaProjection] = None,
+):
     sql_out = db.run_sql(
         """
         select s.*
@@ -61,18 +156,17 @@ def embed_stories(db_config: dict, client: OpenAI):
     """
     )
     unembedded_stories = [StoryRow(*s) for s in sql_out]
-    embedded = 0
     print(f"Embedding {len(unembedded_stories)} stories")
-    for story in unembedded_stories:
-        embedding = get_story_embedding(story, client)
-        embedded += 1
-        print(f"{embedded=}", end="\r")
-        db.insert_row("story_embeddings", {"story_id": story.id, "embedding": str(embedding)})
+    texts = {story.id: story_embedding_text(story) for story in unembedded_stories}
+    asyncio.run(embed_and_write(db, engine, "story_embeddings", "story_id", texts, cache, projection))
 
 
 if __name__ == "__main__":
-    client = OpenAI(api_key=json.load(open("./config.json"))["openai_api_key"])
-    config = json.load(open("./config.json"))["railway"]
+    config = json.load(open("./config.json"))
+    engine = EmbeddingEngine(backend_from_config(config), **config.get("embedding_engine", {}))
+    cache = EmbeddingCache(**config.get("embedding_cache", {}))
+    projection = projection_from_config(config)
+    db = DBHandler(config["railway"], pooled=True, **config.get("db_options", {}))
     parser = argparse.ArgumentParser()
     modes = ["articles", "stories"]
     parser.add_argument("--mode", choices=modes, help="Choose whether to embed articles or stories.")
@@ -83,6 +177,8 @@ if __name__ == "__main__":
         exit(1)
 
     if mode == "articles":
-        embed_articles(config, client)
+        embed_articles(db, engine, cache, projection)
     elif mode == "stories":
-        embed_stories(config, client)
+        embed_stories(db, engine, cache, projection)
+    cache.close()
+    db.close()
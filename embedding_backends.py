@@ -0,0 +1,102 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Optional, Sequence
+
+import numpy as np
+import openai
+from openai import AsyncOpenAI, OpenAI
+from sklearn.feature_extraction.text import HashingVectorizer
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+MODEL_DIMS = {"text-embedding-3-large": 3072, "text-embedding-3-small": 1536, "text-embedding-ada-002": 1536}
+EMBEDDING_DIMS = MODEL_DIMS[EMBEDDING_MODEL]
+HASHING_DIMS = 1024
+
+
+class EmbeddingBackend(ABC):
+    """
+    Turns a batch of texts into embeddings of dims dimensions, in order. model names the embedding
+    space and is part of the embedding cache key, so embeddings from different backends or sizes are
+    never mixed.
+    EmbeddingEngine retries a batch that fails with one of retry_errors, and keeps requests within
+    its rate limits unless rate_limited is False.
+    """
+
+    model: str
+    dims: int
+    retry_errors: tuple[type[Exception], ...] = ()
+    rate_limited: bool = True
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> Sequence[Sequence[float]]:
+        ...
+
+    async def aembed(self, texts: list[str]) -> Sequence[Sequence[float]]:
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """
+    Embeddings from the OpenAI API. With dimensions set, text-embedding-3 models return shortened,
+    renormalized (Matryoshka) embeddings of that size.
+    """
+
+    retry_errors = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = EMBEDDING_MODEL,
+        base_url: Optional[str] = None,
+        dimensions: Optional[int] = None,
+    ):
+        self.api_model = model
+        self.model = model if dimensions is None else f"{model}@{dimensions}"
+        self.dims = dimensions or MODEL_DIMS[model]
+        self.create_options = {"model": model} if dimensions is None else {"model": model, "dimensions": dimensions}
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        # EmbeddingEngine retries batches itself, within its rate limits
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        response = self.client.embeddings.create(input=texts, **self.create_options)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def aembed(self, texts: list[str]) -> list[list[float]]:
+        response = await self.async_client.embeddings.create(input=texts, **self.create_options)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic in-process embeddings, for developing and benchmarking without network. Word
+    unigrams and bigrams, less English stop words, are hashed into dims signed buckets and the
+    counts L2 normalized. Texts sharing words get nearby vectors, but there are no semantics
+    beyond word overlap.
+    """
+
+    rate_limited = False
+
+    def __init__(self, dims: int = HASHING_DIMS):
+        self.model = f"hashing-{dims}"
+        self.dims = dims
+        self.vectorizer = HashingVectorizer(n_features=dims, ngram_range=(1, 2), stop_words="english", norm="l2")
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return self.vectorizer.transform(texts).toarray().astype(np.float32)
+
+
+def backend_from_config(config: dict) -> EmbeddingBackend:
+    """
+    The backend named in config's optional "embedding" block, with the rest of the block as its
+    options, e.g. {"embedding": {"backend": "hashing", "dims": 1024}}. Defaults to OpenAI.
+    """
+    options = dict(config.get("embedding", {}))
+    backend = options.pop("backend", "openai")
+    # Applied to the backend's embeddings before they are stored, see embedding_reduction
+    options.pop("projection", None)
+    if backend == "openai":
+        return OpenAIEmbeddingBackend(api_key=config.get("openai_api_key"), **options)
+    if backend == "hashing":
+        return HashingEmbeddingBackend(**options)
+    raise ValueError(f"Unknown embedding backend {backend}")
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Optional
+
+import numpy as np
+
+from db.embedding_codec import decode_embedding, encode_embedding
+
+EMBEDDING_CACHE_PATH = "cache/embeddings.sqlite"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{normalize_text(text)}".encode(), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings keyed by a hash of the model and the whitespace-normalized input
+    text, so text that has been embedded before is never sent again, whichever row it came from.
+    Kept in a sqlite file at path. Once the stored embeddings exceed max_bytes, the least recently
+    used are evicted down to evict_to of max_bytes.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = 2 * 1024**3, evict_to: float = 0.9):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_to = evict_to
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            create table if not exists embeddings (
+                key blob primary key,
+                embedding blob not null,
+                last_used real not null
+            )
+            """
+        )
+        self.conn.execute("create index if not exists embeddings_last_used_idx on embeddings (last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("select coalesce(sum(length(embedding)), 0) from embeddings").fetchone()[0]
+        self.stats = dict.fromkeys(["hits", "misses", "writes", "evictions"], 0)
+
+    def get_many(self, model: str, texts: list[str]) -> list[Optional[np.ndarray]]:
+        """
+        The cached embedding of each text, or None where it isn't cached.
+        """
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        # Stay well under sqlite's limit on query parameters
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(
+                self.conn.execute(f"select key, embedding from embeddings where key in ({placeholders})", chunk)
+            )
+        if found:
+            now = time.time()
+            self.conn.executemany("update embeddings set last_used = ? where key = ?", [(now, key) for key in found])
+            self.conn.commit()
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(keys) - len(found)
+        return [decode_embedding(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, model: str, texts: list[str], embeddings: list):
+        now = time.time()
+        # Keyed, so repeated texts are stored and counted once
+        rows = list(
+            {
+                cache_key(model, text): (cache_key(model, text), encode_embedding(e), now)
+                for text, e in zip(texts, embeddings)
+            }.values()
+        )
+        with self.conn:
+            replaced = self._stored_bytes([key for key, _, _ in rows])
+            self.conn.executemany(
+                "insert or replace into embeddings (key, embedding, last_used) values (?, ?, ?)", rows
+            )
+        self.size += sum(len(blob) for _, blob, _ in rows) - replaced
+        self.stats["writes"] += len(rows)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _stored_bytes(self, keys: list[bytes]) -> int:
+        stored = 0
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            sql = f"select coalesce(sum(length(embedding)), 0) from embeddings where key in ({placeholders})"
+            stored += self.conn.execute(sql, chunk).fetchone()[0]
+        return stored
+
+    def evict(self):
+        """
+        Drop the least recently used embeddings until the cache is down to evict_to of max_bytes.
+        """
+        target = self.max_bytes * self.evict_to
+        evicted = []
+        cursor = self.conn.execute("select key, length(embedding) from embeddings order by last_used")
+        for key, size in cursor:
+            if self.size <= target:
+                break
+            evicted.append((key,))
+            self.size -= size
+        cursor.close()
+        with self.conn:
+            self.conn.executemany("delete from embeddings where key = ?", evicted)
+        self.stats["evictions"] += len(evicted)
+
+    def summary(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        return (
+            f"Embedding cache: {self.stats['hits']} hits, {self.stats['misses']} misses ({hit_rate:.0%} hit rate), "
+            f"{self.stats['evictions']} evicted, {self.size / 1024**2:.1f}MB stored"
+        )
+
+    def close(self):
+        self.conn.close()
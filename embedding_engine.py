@@ -0,0 +1,139 @@
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Optional, Sequence
+
+from embedding_backends import EmbeddingBackend
+
+# The endpoint takes at most 2048 inputs and 300k tokens per request
+MAX_BATCH_SIZE = 2048
+MAX_BATCH_TOKENS = 300_000
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Upper estimate of the tokens in a text. English averages about four characters per token,
+    so three keeps batches under the token limit without a tokenizer.
+    """
+    return len(text) // 3 + 1
+
+
+class EmbeddingEngine:
+    """
+    Embeds many texts in few requests. Texts are packed in order into batches of at most
+    max_batch_size texts and max_batch_tokens estimated tokens. Up to max_concurrency batches are
+    in flight at once, request starts are kept within requests_per_minute and tokens_per_minute,
+    and batches failing with one of the backend's retry_errors are retried up to retries times with
+    exponential backoff.
+    """
+
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        max_batch_size: int = 256,
+        max_batch_tokens: int = 100_000,
+        max_concurrency: int = 4,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 1_000_000,
+        retries: int = 4,
+        backoff: float = 1.0,
+    ):
+        self.backend = backend
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_SIZE)
+        self.max_batch_tokens = min(max_batch_tokens, MAX_BATCH_TOKENS)
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = dict.fromkeys(["texts", "requests", "retries", "tokens"], 0)
+        self._window: deque[tuple[float, int]] = deque()
+        self._window_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def model(self) -> str:
+        return self.backend.model
+
+    def batches(self, texts: list[str]) -> list[list[int]]:
+        """
+        The indices of texts, packed in order into batches within the size and token budgets.
+        """
+        batches, batch, batch_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) == self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _wait_for_rate_limit(self, tokens: int):
+        """
+        Wait until a request of tokens fits in the last minute's request and token limits.
+        """
+        async with self._window_lock:
+            while True:
+                now = time.monotonic()
+                while self._window and self._window[0][0] <= now - 60:
+                    self._window.popleft()
+                window_tokens = sum(t for _, t in self._window)
+                if not self._window or (
+                    len(self._window) < self.requests_per_minute and window_tokens + tokens <= self.tokens_per_minute
+                ):
+                    self._window.append((now, tokens))
+                    return
+                await asyncio.sleep(self._window[0][0] + 60 - now)
+
+    async def _embed_batch(self, texts: list[str], slots: asyncio.Semaphore) -> Sequence[Sequence[float]]:
+        tokens = sum(estimate_tokens(text) for text in texts)
+        async with slots:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                if self.backend.rate_limited:
+                    await self._wait_for_rate_limit(tokens)
+                self.stats["requests"] += 1
+                try:
+                    embeddings = await self.backend.aembed(texts)
+                except self.backend.retry_errors:
+                    if attempt == self.retries:
+                        raise
+                    continue
+                self.stats["texts"] += len(texts)
+                self.stats["tokens"] += tokens
+                return embeddings
+
+    async def embed_batches(self, texts: list[str]) -> AsyncIterator[tuple[list[int], Sequence[Sequence[float]]]]:
+        """
+        Embed texts, yielding (indices, embeddings) for each batch as it completes, which is not
+        necessarily in order.
+        """
+        slots = asyncio.Semaphore(self.max_concurrency)
+        # Made here rather than in __init__, since asyncio locks are tied to the running event loop
+        self._window_lock = asyncio.Lock()
+
+        async def embed_batch(batch: list[int]) -> tuple[list[int], Sequence[Sequence[float]]]:
+            return batch, await self._embed_batch([texts[i] for i in batch], slots)
+
+        tasks = [asyncio.create_task(embed_batch(batch)) for batch in self.batches(texts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # A failed batch, or a caller that stops early, leaves the other batches unwanted
+            for task in tasks:
+                task.cancel()
+
+    async def embed(self, texts: list[str]) -> list[Sequence[float]]:
+        """
+        Embed texts, returning their embeddings in order.
+        """
+        embeddings = [None] * len(texts)
+        async for indices, batch_embeddings in self.embed_batches(texts):
+            for i, embedding in zip(indices, batch_embeddings):
+                embeddings[i] = embedding
+        return embeddings
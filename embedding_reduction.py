@@ -0,0 +1,177 @@
+import argparse
+import functools
+import json
+import os
+from typing import Iterator, Optional
+
+import numpy as np
+
+from db.db_connection import DBHandler
+from db.embedding_codec import EMBEDDING_DTYPE, decode_embeddings, encode_embedding
+from embedding_backends import EMBEDDING_DIMS, EMBEDDING_MODEL, HASHING_DIMS, MODEL_DIMS
+
+PCA_PROJECTION_PATH = "artifacts/embedding_pca.npz"
+EMBEDDING_TABLES = {"article_embeddings": "article_id", "story_embeddings": "story_id"}
+
+STORED_EMBEDDINGS_SQL = """
+        select {key_column}, embedding
+        from {table}
+        where octet_length(embedding) = %s
+    """
+
+UPDATE_EMBEDDINGS_SQL = """
+        update {table} t
+        set embedding = d.embedding
+        from unnest(%s::int[], %s::bytea[]) as d(id, embedding)
+        where t.{key_column} = d.id
+    """
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def truncate_embeddings(embeddings: np.ndarray, dims: int) -> np.ndarray:
+    """
+    Matryoshka-style reduction: keep the first dims dimensions and renormalize. For the
+    text-embedding-3 models this matches asking the API for dims dimensions.
+    """
+    return normalize(np.asarray(embeddings, dtype=np.float32)[:, :dims])
+
+
+class PcaProjection:
+    """
+    A linear projection of embeddings onto their top principal components, fitted once and saved as
+    an .npz artifact so every run projects into the same space. Projected vectors are renormalized.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+
+    @property
+    def source_dims(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def dims(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, dims: int) -> "PcaProjection":
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if dims > min(embeddings.shape):
+            raise ValueError(f"Can't fit {dims} components to {embeddings.shape[0]}x{embeddings.shape[1]} embeddings")
+        mean = embeddings.mean(axis=0)
+        _, _, vt = np.linalg.svd(embeddings - mean, full_matrices=False)
+        return cls(mean, vt[:dims])
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        return normalize((np.asarray(embeddings, dtype=np.float32) - self.mean) @ self.components.T)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, mean=self.mean, components=self.components)
+
+    @classmethod
+    def load(cls, path: str) -> "PcaProjection":
+        with np.load(path) as artifact:
+            return cls(artifact["mean"], artifact["components"])
+
+
+def projection_from_config(config: dict) -> Optional[PcaProjection]:
+    """
+    The PCA projection at the "projection" path of config's "embedding" block, if there is one.
+    """
+    path = config.get("embedding", {}).get("projection")
+    return PcaProjection.load(path) if path else None
+
+
+def embedding_dims(config: dict) -> int:
+    """
+    Dimensions of the embeddings stored with config's "embedding" block, which readers select by.
+    """
+    options = config.get("embedding", {})
+    if options.get("projection"):
+        return projection_from_config(config).dims
+    if options.get("backend") == "hashing":
+        return options.get("dims", HASHING_DIMS)
+    return options.get("dimensions") or MODEL_DIMS[options.get("model", EMBEDDING_MODEL)]
+
+
+def load_stored_embeddings(db: DBHandler, table: str, dims: int) -> tuple[list[int], np.ndarray]:
+    sql = STORED_EMBEDDINGS_SQL.format(table=table, key_column=EMBEDDING_TABLES[table])
+    ids, blobs = [], []
+    for key, blob in db.iter_sql(sql, (dims * EMBEDDING_DTYPE.itemsize,), itersize=1000):
+        ids.append(key)
+        blobs.append(blob)
+    return ids, decode_embeddings(blobs)
+
+
+def iter_stored_embeddings(
+    db: DBHandler, table: str, dims: int, batch_size: int = 1000
+) -> Iterator[tuple[list[int], np.ndarray]]:
+    """
+    The table's embeddings of dims dimensions as (ids, embeddings) chunks of up to batch_size rows.
+    """
+    sql = STORED_EMBEDDINGS_SQL.format(table=table, key_column=EMBEDDING_TABLES[table])
+    ids, blobs = [], []
+    for key, blob in db.iter_sql(sql, (dims * EMBEDDING_DTYPE.itemsize,), itersize=batch_size):
+        ids.append(key)
+        blobs.append(blob)
+        if len(ids) == batch_size:
+            yield ids, decode_embeddings(blobs)
+            ids, blobs = [], []
+    if ids:
+        yield ids, decode_embeddings(blobs)
+
+
+def reduce_stored_embeddings(db: DBHandler, table: str, source_dims: int, reduce, batch_size: int = 1000) -> int:
+    """
+    Rewrite the table's embeddings of source_dims dimensions with reduce(embeddings), so rows
+    embedded before a reduction was configured are stored and read at the reduced size.
+    Embeddings are streamed and each chunk commits on its own. Reduced rows no longer match
+    source_dims, so an interrupted run picks up where it stopped.
+    """
+    sql = UPDATE_EMBEDDINGS_SQL.format(table=table, key_column=EMBEDDING_TABLES[table])
+    reduced_rows = 0
+    for ids, embeddings in iter_stored_embeddings(db, table, source_dims, batch_size):
+        blobs = [encode_embedding(e) for e in reduce(embeddings)]
+        with db.transaction():
+            db.run_sql_no_return(sql, (ids, blobs))
+        reduced_rows += len(ids)
+    return reduced_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit a PCA projection, or reduce stored embeddings.")
+    parser.add_argument("action", choices=["fit", "reduce"])
+    parser.add_argument("--dims", type=int, required=True, help="Dimensions to reduce to.")
+    parser.add_argument("--source-dims", type=int, default=EMBEDDING_DIMS)
+    parser.add_argument("--method", choices=["truncate", "pca"], default="pca")
+    parser.add_argument("--projection", default=PCA_PROJECTION_PATH, help="Path of the .npz PCA projection artifact.")
+    parser.add_argument("--table", choices=list(EMBEDDING_TABLES), nargs="+", default=list(EMBEDDING_TABLES))
+    args = parser.parse_args()
+
+    config = json.load(open("./config.json"))
+    db = DBHandler(config["railway"], pooled=True, **config.get("db_options", {}))
+    if args.action == "fit":
+        # Fitted on articles and stories together, so both are projected into the same space
+        matrices = [load_stored_embeddings(db, table, args.source_dims)[1] for table in args.table]
+        embeddings = np.vstack([m for m in matrices if len(m)])
+        projection = PcaProjection.fit(embeddings, args.dims)
+        projection.save(args.projection)
+        print(f"Fitted a {projection.source_dims} to {projection.dims} projection on {len(embeddings)} embeddings")
+    else:
+        if args.method == "pca":
+            projection = PcaProjection.load(args.projection)
+            if (projection.source_dims, projection.dims) != (args.source_dims, args.dims):
+                raise ValueError(f"{args.projection} projects {projection.source_dims} to {projection.dims} dims")
+            reduce = projection.transform
+        else:
+            reduce = functools.partial(truncate_embeddings, dims=args.dims)
+        for table in args.table:
+            n = reduce_stored_embeddings(db, table, args.source_dims, reduce)
+            print(f"Reduced {n} {table} from {args.source_dims} to {args.dims} dims")
+    db.close()
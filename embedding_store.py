@@ -0,0 +1,134 @@
+import os
+from typing import Iterable
+
+import numpy as np
+
+from db.db_connection import DBHandler
+from db.embedding_codec import EMBEDDING_DTYPE
+from db.queries import STORE_ARTICLE_EMBEDDINGS_SQL, STORE_STORY_EMBEDDINGS_SQL
+
+EMBEDDING_STORE_DIR = "cache/embeddings"
+ID_DTYPE = np.dtype("<i8")
+# Query for each stored table, with a {condition} on e.{key column} selecting new or missing rows
+STORE_TABLES = {
+    "article_embeddings": (STORE_ARTICLE_EMBEDDINGS_SQL, "article_id"),
+    "story_embeddings": (STORE_STORY_EMBEDDINGS_SQL, "story_id"),
+}
+
+
+class EmbeddingStore:
+    """
+    Append-only local copy of the embeddings of one table and size. Rows are float32 vectors in a
+    memory-mapped file, with their ids, in the same order, in a second file. sync() appends the
+    rows with ids above the highest stored id, and backfill() fetches given ids that are missing,
+    such as embeddings written late for older rows. If the table's highest id drops below the
+    stored one, the table was recreated and the store starts over.
+
+    rows() gathers a window's embeddings from the memory map, so only the pages holding them are
+    read, and no embeddings are transferred from the db except those added since the last run.
+    """
+
+    def __init__(self, table: str, dims: int, path: str = EMBEDDING_STORE_DIR, chunk_rows: int = 5000):
+        os.makedirs(path, exist_ok=True)
+        self.table = table
+        self.dims = dims
+        self.chunk_rows = chunk_rows
+        self.sql, self.key_column = STORE_TABLES[table]
+        self.data_path = os.path.join(path, f"{table}_{dims}.f32")
+        self.ids_path = os.path.join(path, f"{table}_{dims}.ids")
+        self.row_bytes = dims * EMBEDDING_DTYPE.itemsize
+        self.ids = (
+            np.fromfile(self.ids_path, dtype=ID_DTYPE) if os.path.exists(self.ids_path) else np.empty(0, ID_DTYPE)
+        )
+        # Data is appended before ids, so an interrupted append can only leave rows without ids,
+        # which are cut off here
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > len(self.ids) * self.row_bytes:
+            os.truncate(self.data_path, len(self.ids) * self.row_bytes)
+        self.row_of = {key: row for row, key in enumerate(self.ids.tolist())}
+        self._map()
+
+    def _reset(self):
+        for path in (self.data_path, self.ids_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.ids = np.empty(0, ID_DTYPE)
+        self.row_of = {}
+        self._map()
+
+    def _map(self):
+        if len(self.ids):
+            self.matrix = np.memmap(self.data_path, dtype=EMBEDDING_DTYPE, mode="r", shape=(len(self.ids), self.dims))
+        else:
+            self.matrix = np.empty((0, self.dims), dtype=EMBEDDING_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def watermark(self) -> int:
+        return int(self.ids.max()) if len(self.ids) else 0
+
+    def append(self, ids: list[int], blobs: list[bytes]):
+        """
+        Append rows of encoded embeddings, skipping ids already stored.
+        """
+        new = [(key, blob) for key, blob in zip(ids, blobs) if key not in self.row_of]
+        if not new:
+            return
+        with open(self.data_path, "ab") as f:
+            f.write(b"".join(blob for _, blob in new))
+        new_ids = np.array([key for key, _ in new], dtype=ID_DTYPE)
+        with open(self.ids_path, "ab") as f:
+            f.write(new_ids.tobytes())
+        for row, key in enumerate(new_ids.tolist(), start=len(self.ids)):
+            self.row_of[key] = row
+        self.ids = np.concatenate([self.ids, new_ids])
+        self._map()
+
+    def _fetch(self, db: DBHandler, condition: str, value) -> int:
+        sql = self.sql.format(condition=condition.format(key=f"e.{self.key_column}"))
+        fetched = 0
+        ids, blobs = [], []
+        for key, blob in db.iter_sql(sql, (self.row_bytes, value), itersize=1000):
+            ids.append(key)
+            blobs.append(bytes(blob))
+            if len(ids) == self.chunk_rows:
+                self.append(ids, blobs)
+                fetched += len(ids)
+                ids, blobs = [], []
+        self.append(ids, blobs)
+        return fetched + len(ids)
+
+    def sync(self, db: DBHandler) -> int:
+        """
+        Append the rows above the watermark. Returns how many were fetched.
+        """
+        ((max_id,),) = db.run_sql(f"select coalesce(max({self.key_column}), 0) from {self.table}")
+        if max_id < self.watermark:
+            print(f"{self.table} ids go up to {max_id}, below the store's {self.watermark}; rebuilding the store")
+            self._reset()
+        return self._fetch(db, "{key} > %s", self.watermark)
+
+    def backfill(self, db: DBHandler, ids: Iterable[int]) -> int:
+        """
+        Fetch those of ids that aren't stored yet. Returns how many were fetched.
+        """
+        missing = [key for key in ids if key not in self.row_of]
+        if not missing:
+            return 0
+        return self._fetch(db, "{key} = any(%s)", missing)
+
+    def synced_rows(self, db: DBHandler, ids: list[int]) -> np.ndarray:
+        """
+        Sync, fetch any of ids still missing, and return their embeddings as rows() does.
+        """
+        self.sync(db)
+        self.backfill(db, ids)
+        return self.rows(ids)
+
+    def rows(self, ids: list[int]) -> np.ndarray:
+        """
+        The embeddings of ids, in order. Raises KeyError for ids not in the store.
+        """
+        positions = np.fromiter((self.row_of[key] for key in ids), dtype=np.int64, count=len(ids))
+        return np.asarray(self.matrix[positions])
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+HOMEPAGE_CACHE_PATH = "cache/homepages.json"
+
+
+@dataclass
+class HomepageEntry:
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body_hash: Optional[str] = None
+    links: list[str] = field(default_factory=list)
+    # Links passed over for the provider's link budget, offered again next run
+    deferred: list[str] = field(default_factory=list)
+    # Links whose download or parse failed, offered again next run
+    failed: list[str] = field(default_factory=list)
+    bytes: int = 0
+    parse_seconds: float = 0.0
+
+
+def body_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class HomepageCache:
+    """
+    Per-provider record of the last homepage fetch: its validators for a conditional GET, a hash of
+    the body, and the article links extracted from it. Kept as JSON at path, written by save(), or
+    only in memory if path is None.
+    """
+
+    def __init__(self, path: Optional[str] = HOMEPAGE_CACHE_PATH):
+        self.path = path
+        self.entries: dict[str, HomepageEntry] = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.entries = {name: HomepageEntry(**entry) for name, entry in json.load(f).items()}
+
+    def get(self, provider_name: str) -> Optional[HomepageEntry]:
+        return self.entries.get(provider_name)
+
+    def put(self, provider_name: str, entry: HomepageEntry):
+        self.entries[provider_name] = entry
+
+    @staticmethod
+    def conditional_headers(entry: Optional[HomepageEntry]) -> dict[str, str]:
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({name: asdict(entry) for name, entry in self.entries.items()}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,109 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+import httpx
+
+# Dropped when recording, since the archived body is stored decoded
+UNARCHIVED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+class HttpArchive:
+    """
+    On-disk archive of HTTP responses. Bodies are stored gzipped under blobs/, named by their sha256,
+    so a body fetched many times is stored once. index.jsonl maps each GET url to its status,
+    headers and body hash; when a url is recorded more than once the last record wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = os.path.join(path, "index.jsonl")
+        self.records: dict[str, dict] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.records[record["url"]] = record
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, "blobs", digest[:2], f"{digest}.gz")
+
+    def add(self, url: str, status: int, headers: dict[str, str], content: bytes, elapsed: float):
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            with gzip.open(blob_path, "wb") as f:
+                f.write(content)
+        record = {"url": url, "status": status, "headers": headers, "body": digest, "elapsed": elapsed}
+        self.records[url] = record
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def get(self, url: str) -> Optional[tuple[dict, bytes]]:
+        record = self.records.get(url)
+        if record is None:
+            return None
+        with gzip.open(self._blob_path(record["body"]), "rb") as f:
+            return record, f.read()
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that sends requests over the network and archives every GET response.
+    """
+
+    def __init__(self, archive: HttpArchive, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.archive = archive
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        os.makedirs(archive.path, exist_ok=True)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        content = await response.aread()
+        await response.aclose()
+        headers = {k.lower(): v for k, v in response.headers.items() if k.lower() not in UNARCHIVED_HEADERS}
+        # A 304 only answers this run's conditional GET, so the archived full response is kept
+        if request.method == "GET" and response.status_code != 304:
+            self.archive.add(str(request.url), response.status_code, headers, content, time.monotonic() - start)
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that answers requests from an archive, after latency seconds, or after the
+    recorded response time if latency is None. Conditional GETs matching the archived ETag or
+    Last-Modified get a 304. Urls missing from the archive get a 404.
+    """
+
+    def __init__(self, archive: HttpArchive, latency: Optional[float] = 0.0):
+        self.archive = archive
+        self.latency = latency
+        self.hits = 0
+        self.misses = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        archived = self.archive.get(str(request.url))
+        delay = self.latency if self.latency is not None or archived is None else archived[0]["elapsed"]
+        if delay:
+            await asyncio.sleep(delay)
+        if archived is None:
+            self.misses += 1
+            return httpx.Response(404, request=request)
+        self.hits += 1
+        record, content = archived
+        headers = record["headers"]
+        etag, last_modified = headers.get("etag"), headers.get("last-modified")
+        if (etag and request.headers.get("if-none-match") == etag) or (
+            last_modified and request.headers.get("if-modified-since") == last_modified
+        ):
+            return httpx.Response(304, headers=headers, request=request)
+        return httpx.Response(record["status"], headers=headers, content=content, request=request)
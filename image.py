@@ -3,6 +3,7 @@ import json
 from googleapiclient.discovery import Resource, build
 
 from db.db_connection import DBHandler
+from db.queries import LATEST_STORY_DIGEST_SQL, STORIES_WITHOUT_IMAGES_SQL
 from digest_status import DigestStatus, digest_status_transition
 
 
@@ -13,23 +14,9 @@ class ImageGuy:
         self._g_id = g_id
 
     def _get_stories_without_images(self) -> list[dict]:
-        latest_digest_id = self._db.run_sql(
-            """
-            select max(digest_id)
-            from stories
-            """
-        )[0][0]
+        latest_digest_id = self._db.run_sql(LATEST_STORY_DIGEST_SQL)[0][0]
         stories = [
-            {"id": i[0], "title": i[1]}
-            for i in self._db.run_sql(
-                """
-            select s.id, s.title
-            from stories s
-            where s.id not in (select story_id from images)
-            and s.digest_id = %s
-            """,
-                (latest_digest_id,),
-            )
+            {"id": i[0], "title": i[1]} for i in self._db.run_sql(STORIES_WITHOUT_IMAGES_SQL, (latest_digest_id,))
         ]
         return stories
 
@@ -61,23 +48,22 @@ class ImageGuy:
         for i, story in enumerate(stories):
             print(i, end="\r")
             images = self._google_custom_image_search(story["title"])
-            for img in images:
-                self._db.insert_row("images", {"story_id": story["id"], **img})
+            self._db.insert_rows("images", [{"story_id": story["id"], **img} for img in images])
 
 
 @digest_status_transition(
     expected_status=DigestStatus.STORIES_EMBEDDED,
     final_status=DigestStatus.IMAGES_COLLECTED,
 )
-def run(db_config: dict, g_key: str, g_id: str):
-    db = DBHandler(db_config)
+def run(db: DBHandler, g_key: str, g_id: str):
     ig = ImageGuy(db, g_key, g_id)
     ig.collect_images()
 
 
 if __name__ == "__main__":
     config = json.load(open("config.json"))
-    db_config = config["railway"]
+    db = DBHandler(config["railway"], pooled=True, **config.get("db_options", {}))
     g_key = config["google_search_key"]
     g_id = config["google_search_engine_id"]
-    run(db_config, g_key, g_id)
+    run(db, g_key, g_id)
+    db.close()
@@ -0,0 +1,159 @@
+import asyncio
+import io
+import os
+from typing import Optional
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from downloader import AsyncDownloader
+from seen_urls import url_hash
+
+IMAGE_VERDICTS_PATH = "cache/image_verdicts.bin"
+VERDICT_DTYPE = np.dtype([("hash", "<u8"), ("ok", "u1")])
+
+
+def is_logo_by_colors(image: Image.Image, color_threshold: int = 100) -> bool:
+    # getcolors returns None once there are more than maxcolors colours, without counting them all,
+    # so this is fewer than color_threshold colours
+    return image.convert("RGB").getcolors(maxcolors=color_threshold - 1) is not None
+
+
+def has_transparency(image: Image.Image) -> bool:
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        return image.getchannel("A").getextrema()[0] < 255
+    return False
+
+
+class ImageChecker:
+    """
+    Decides whether article image urls are worth keeping: an image, at least min_size pixels each
+    way, with no transparency and at least color_threshold colours (fewer suggests a logo).
+
+    The first range_bytes of each image are fetched, which is usually enough to read its size from
+    the header and reject small images. Images that pass are decoded to a thumbnail of at most
+    thumbnail_size pixels for the colour and transparency checks.
+    Verdicts are cached by url hash and persisted to path, and concurrent checks of the same url
+    share one fetch, so images shared across articles are only checked once.
+    """
+
+    def __init__(
+        self,
+        downloader: AsyncDownloader,
+        path: str = IMAGE_VERDICTS_PATH,
+        min_size: int = 100,
+        color_threshold: int = 100,
+        range_bytes: int = 65536,
+        thumbnail_size: int = 128,
+    ):
+        self.downloader = downloader
+        self.path = path
+        self.min_size = min_size
+        self.color_threshold = color_threshold
+        self.range_bytes = range_bytes
+        self.thumbnail_size = thumbnail_size
+        self.verdicts: dict[int, bool] = {}
+        self._new_verdicts: dict[int, bool] = {}
+        self._pending: dict[int, asyncio.Future] = {}
+        self.stats = dict.fromkeys(["checked", "cached", "kept", "bytes"], 0)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            # A run interrupted mid-write can leave a partial record at the end
+            records = np.frombuffer(data[: len(data) - len(data) % VERDICT_DTYPE.itemsize], dtype=VERDICT_DTYPE)
+            self.verdicts = dict(zip(records["hash"].tolist(), records["ok"].astype(bool).tolist()))
+
+    def _verdict_from_image(self, content: bytes) -> bool:
+        image = Image.open(io.BytesIO(content))
+        if image.size[0] < self.min_size or image.size[1] < self.min_size:
+            return False
+        # For JPEGs draft() decodes straight at a reduced scale, which is much cheaper than a full decode
+        image.draft("RGB", (self.thumbnail_size, self.thumbnail_size))
+        image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+        if has_transparency(image):
+            return False
+        if is_logo_by_colors(image, self.color_threshold):
+            return False
+        return True
+
+    def _size_from_header(self, content: bytes) -> Optional[tuple[int, int]]:
+        try:
+            return Image.open(io.BytesIO(content)).size
+        except (PIL.UnidentifiedImageError, OSError):
+            return None
+
+    async def _check_url(self, url: str) -> Optional[bool]:
+        """
+        The verdict for an image, or None if it couldn't be fetched.
+        """
+        result = await self.downloader.fetch(url, headers={"Range": f"bytes=0-{self.range_bytes - 1}"})
+        self.stats["bytes"] += result.bytes_downloaded
+        if result.status is None or result.status >= 500:
+            return None
+        if not result.ok or not result.content_type.startswith("image/"):
+            return False
+        content = result.content
+        try:
+            size = self._size_from_header(content)
+        except Image.DecompressionBombError:
+            # The header claims more pixels than PIL will open
+            return False
+        if size is not None and (size[0] < self.min_size or size[1] < self.min_size):
+            return False
+        if result.status == 206:
+            total = result.headers.get("content-range", "").rpartition("/")[2]
+            if not total.isdigit() or int(total) > len(content):
+                result = await self.downloader.fetch(url)
+                self.stats["bytes"] += result.bytes_downloaded
+                if not result.ok:
+                    return None
+                content = result.content
+        try:
+            return await asyncio.to_thread(self._verdict_from_image, content)
+        except (PIL.UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+            return False
+
+    async def check(self, url: str) -> bool:
+        key = url_hash(url)
+        if key in self.verdicts:
+            self.stats["cached"] += 1
+            return self.verdicts[key]
+        if key in self._pending:
+            self.stats["cached"] += 1
+            return await self._pending[key]
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            verdict = await self._check_url(url)
+        except BaseException:
+            # Checks waiting on this one reject the image rather than fail with it
+            future.set_result(False)
+            raise
+        finally:
+            del self._pending[key]
+        future.set_result(bool(verdict))
+        self.stats["checked"] += 1
+        if verdict is not None:
+            # Fetch failures aren't cached, so the image is checked again next time
+            self.verdicts[key] = self._new_verdicts[key] = verdict
+        self.stats["kept"] += bool(verdict)
+        return bool(verdict)
+
+    async def filter(self, urls: list[str]) -> list[str]:
+        verdicts = await asyncio.gather(*[self.check(url) for url in urls])
+        return [url for url, ok in zip(urls, verdicts) if ok]
+
+    def save(self):
+        if not self._new_verdicts:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        records = np.array(
+            [(key, verdict) for key, verdict in self._new_verdicts.items()],
+            dtype=VERDICT_DTYPE,
+        )
+        with open(self.path, "ab") as f:
+            f.write(records.tobytes())
+        self._new_verdicts = {}
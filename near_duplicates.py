@@ -0,0 +1,132 @@
+import datetime as dt
+import re
+import zlib
+from collections import defaultdict
+from typing import Optional
+
+import numpy as np
+
+from db.async_db_connection import AsyncDBHandler
+from db.db_connection import DBHandler
+from db.queries import RECENT_REPRESENTATIVES_SQL
+
+NUM_PERM = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+DUPLICATE_THRESHOLD = 0.8
+SIGNATURE_DTYPE = np.dtype("<u4")
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+# Coefficients below 2**32 keep a * hash + b within uint64 for 32-bit shingle hashes
+_rng = np.random.default_rng(20250101)
+PERM_A = _rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+
+SET_DUPLICATE_OF_SQL = """
+        update articles a
+        set duplicate_of = d.representative_id
+        from unnest(%s::int[], %s::int[]) as d(id, representative_id)
+        where a.id = d.id
+    """
+
+
+def normalize_body(text: str) -> list[str]:
+    return re.sub(r"[^\w\s]", " ", text.lower()).split()
+
+
+def minhash_signature(text: str) -> bytes:
+    """
+    MinHash signature of the word shingles of an article body, as NUM_PERM little-endian uint32s.
+    """
+    words = normalize_body(text)
+    n = max(len(words) - SHINGLE_WORDS + 1, 1)
+    shingles = {" ".join(words[i : i + SHINGLE_WORDS]) for i in range(n)}
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (np.outer(hashes, PERM_A) + PERM_B) % MERSENNE_PRIME
+    return (permuted.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(SIGNATURE_DTYPE).tobytes()
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """
+    Estimated Jaccard similarity of the shingle sets behind two signatures.
+    """
+    return float(np.mean(np.frombuffer(a, dtype=SIGNATURE_DTYPE) == np.frombuffer(b, dtype=SIGNATURE_DTYPE)))
+
+
+class NearDuplicateIndex:
+    """
+    LSH index over the MinHash signatures of recent representative articles, i.e. those that are
+    not themselves duplicates. Signatures are split into BANDS bands; articles sharing any band are
+    candidates, and a candidate is a duplicate when its estimated similarity is at least threshold.
+    """
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.signatures: dict[int, bytes] = {}
+        self.buckets: list[dict[bytes, list[int]]] = [defaultdict(list) for _ in range(BANDS)]
+
+    @staticmethod
+    def _bands(signature: bytes) -> list[bytes]:
+        step = ROWS_PER_BAND * SIGNATURE_DTYPE.itemsize
+        return [signature[i * step : (i + 1) * step] for i in range(BANDS)]
+
+    def add(self, article_id: int, signature: bytes):
+        self.signatures[article_id] = signature
+        for bucket, band in zip(self.buckets, self._bands(signature)):
+            bucket[band].append(article_id)
+
+    def merge(self, other: "NearDuplicateIndex"):
+        for article_id, signature in other.signatures.items():
+            self.add(article_id, signature)
+
+    def best_match(self, signature: bytes) -> tuple[Optional[int], float]:
+        """
+        The most similar representative at or above the threshold, if there is one, and its similarity.
+        """
+        candidates = {
+            article_id
+            for bucket, band in zip(self.buckets, self._bands(signature))
+            for article_id in bucket.get(band, [])
+        }
+        best_id, best = None, self.threshold
+        for article_id in candidates:
+            score = similarity(signature, self.signatures[article_id])
+            if score >= best:
+                best_id, best = article_id, score
+        return best_id, best
+
+    def find(self, signature: bytes) -> Optional[int]:
+        return self.best_match(signature)[0]
+
+    def load(self, db: DBHandler, window_hours: int = 72) -> int:
+        since = dt.datetime.now() - dt.timedelta(hours=window_hours)
+        for article_id, signature in db.iter_sql(RECENT_REPRESENTATIVES_SQL, (since,), itersize=10000):
+            self.add(article_id, bytes(signature))
+        return len(self.signatures)
+
+    async def write_articles(self, db: AsyncDBHandler, articles: list[tuple[int, bytes]]) -> dict[int, int]:
+        """
+        Record the signatures of newly written (id, signature) articles, pointing each near-duplicate
+        at its representative and indexing the rest as representatives. In a transaction, the new
+        representatives are only indexed once it commits, so a rolled back batch leaves no ids behind.
+        Returns the duplicates found, as {article id: representative id}.
+        """
+        duplicates = {}
+        # Articles of the batch can also be duplicates of each other
+        batch = NearDuplicateIndex(self.threshold)
+        for article_id, signature in articles:
+            matches = [m for m in (self.best_match(signature), batch.best_match(signature)) if m[0] is not None]
+            if matches:
+                duplicates[article_id] = max(matches, key=lambda m: m[1])[0]
+            else:
+                batch.add(article_id, signature)
+        await db.insert_rows(
+            "article_minhashes",
+            [{"article_id": article_id, "signature": signature} for article_id, signature in articles],
+            on_conflict="do nothing",
+        )
+        if duplicates:
+            await db.run_sql_no_return(SET_DUPLICATE_OF_SQL, (list(duplicates.keys()), list(duplicates.values())))
+        db.on_commit(lambda: self.merge(batch))
+        return duplicates
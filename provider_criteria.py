@@ -1,33 +1,71 @@
-from typing import Dict, Set
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Optional, Pattern, Set
 
 from newspaper.article import Article
 
+CRITERIA_KEYS = {"whitelist_categories", "blacklist_categories"}
+
+
+@lru_cache(maxsize=None)
+def _category_pattern(categories: FrozenSet[str]) -> Pattern:
+    """
+    One regex matching any category as a path segment or host label: /category/, /category. or
+    .category. anywhere in a url.
+    """
+    alternation = "|".join(re.escape(category) for category in sorted(categories))
+    return re.compile(rf"/(?:{alternation})[/.]|\.(?:{alternation})\.")
+
+
+def _matches_category(url: str, categories: Set[str]) -> bool:
+    return bool(categories) and _category_pattern(frozenset(categories)).search(url) is not None
+
 
 def is_blacklisted(article: Article, blacklist_categories: Set[str]) -> bool:
-    for category in blacklist_categories:
-        if f"/{category}/" in article.url or f"/{category}." in article.url or f".{category}." in article.url:
-            return True
-    return False
+    return _matches_category(article.url, blacklist_categories)
 
 
 def is_whitelisted(article: Article, whitelist_categories: Set[str]) -> bool:
-    for category in whitelist_categories:
-        if f"/{category}/" in article.url or f"/{category}." in article.url or f".{category}." in article.url:
-            return True
-    return False
+    return _matches_category(article.url, whitelist_categories)
 
 
-def check_article(provider_name: str, article: Article) -> bool:
-    criteria = provider_criteria[provider_name]
-    if whitelist := criteria.get("whitelist_categories"):
-        if not is_whitelisted(article, whitelist):
-            return False
-    if blacklist := criteria.get("blacklist_categories"):
-        if is_blacklisted(article, blacklist):
-            return False
+@dataclass
+class CompiledCriteria:
+    whitelist: Optional[Pattern] = None
+    blacklist: Optional[Pattern] = None
+
+
+def compile_criteria(criteria: Dict[str, Dict[str, Set[str]]]) -> Dict[str, CompiledCriteria]:
+    """
+    Compile each provider's whitelist and blacklist into a single regex. An empty list matches nothing
+    and is left out, as before. Raises ValueError for unknown keys, so a misspelt list isn't ignored.
+    """
+    compiled = {}
+    for provider_name, lists in criteria.items():
+        if unknown := set(lists) - CRITERIA_KEYS:
+            raise ValueError(f"Unknown provider criteria for {provider_name}: {', '.join(sorted(unknown))}")
+        whitelist, blacklist = lists.get("whitelist_categories"), lists.get("blacklist_categories")
+        compiled[provider_name] = CompiledCriteria(
+            whitelist=_category_pattern(frozenset(whitelist)) if whitelist else None,
+            blacklist=_category_pattern(frozenset(blacklist)) if blacklist else None,
+        )
+    return compiled
+
+
+def check_url(provider_name: str, url: str) -> bool:
+    criteria = compiled_criteria[provider_name]
+    if criteria.whitelist is not None and criteria.whitelist.search(url) is None:
+        return False
+    if criteria.blacklist is not None and criteria.blacklist.search(url) is not None:
+        return False
     return True
 
 
+def check_article(provider_name: str, article: Article) -> bool:
+    return check_url(provider_name, article.url)
+
+
 provider_criteria: Dict[str, Dict[str, Set[str]]] = {
     "9 News": {"whitelist_categories": {"national", "world"}},
     "ABC News": {"blacklist_categories": {"everyday"}},
@@ -83,7 +121,7 @@ provider_criteria: Dict[str, Dict[str, Set[str]]] = {
     },
     "Japan Today": {
         "whitelist_categories": {"japantoday"},
-        "blacklist_cateogories": {"sports", "quote-of-the-day", "have-your-say", "features", "entertainment"},
+        "blacklist_categories": {"sports", "quote-of-the-day", "have-your-say", "features", "entertainment"},
     },
     "Hindustan Times": {
         "whitelist_categories": {"world-news"},
@@ -123,7 +161,7 @@ provider_criteria: Dict[str, Dict[str, Set[str]]] = {
             "video",
         }
     },
-    "The Independent": {"whiteliest_categories": {"news"}},
+    "The Independent": {"whitelist_categories": {"news"}},
     "The New York Times": {
         "blacklist_categories": {
             "arts",
@@ -192,3 +230,5 @@ provider_criteria: Dict[str, Dict[str, Set[str]]] = {
     },
     "Yahoo News": {"whitelist_categories": {"news"}},
 }
+
+compiled_criteria = compile_criteria(provider_criteria)
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import struct
+from typing import Iterable, Optional
+
+import numpy as np
+
+from db.db_connection import DBHandler
+
+SEEN_URLS_PATH = "cache/seen_urls.bin"
+HEADER = struct.Struct("<q")
+HASH_DTYPE = np.dtype("<u8")
+# Article ids are allocated when a row is inserted but only become visible when its transaction
+# commits, so a concurrent writer can commit ids below the watermark after a sync has moved past them
+SYNC_MARGIN_IDS = 10000
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    The form article urls are stored and compared in: query string and fragment dropped.
+    """
+    url = url.split("?")[0]
+    url = url.split("#")[0]
+    return url
+
+
+def url_hash(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(canonicalize_url(url).encode(), digest_size=8).digest(), "little")
+
+
+class SeenUrlIndex:
+    """
+    Set of 64-bit hashes of every article url already stored, so the collector can drop known
+    articles with a constant-time lookup instead of pulling all urls from the db each run.
+
+    The index is persisted to path as an 8-byte watermark (the highest articles.id synced)
+    followed by an append-only run of hashes. sync() reads articles above the watermark, less
+    SYNC_MARGIN_IDS to pick up rows committed late, and add() appends urls as they are written.
+    Deleted articles stay in the index. With path None the index is only kept in memory.
+
+    The hashes are loaded into a Python set, roughly 70 bytes per url, which trades memory for
+    cheap lookups and inserts; at a few hundred thousand articles that is still tens of MB.
+    """
+
+    def __init__(self, path: Optional[str] = SEEN_URLS_PATH):
+        self.path = path
+        self.watermark = 0
+        self._hashes: set[int] = set()
+        self._load()
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            (self.watermark,) = HEADER.unpack(header)
+            data = f.read()
+        # A run interrupted mid-write can leave a partial hash at the end
+        usable = len(data) - len(data) % HASH_DTYPE.itemsize
+        self._hashes = set(np.frombuffer(data[:usable], dtype=HASH_DTYPE).tolist())
+
+    def _reset(self):
+        self.watermark = 0
+        self._hashes = set()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _append(self, hashes: list[int], watermark: Optional[int] = None):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if not os.path.exists(self.path):
+            with open(self.path, "wb") as f:
+                f.write(HEADER.pack(self.watermark))
+        with open(self.path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            f.write(np.array(hashes, dtype=HASH_DTYPE).tobytes())
+            if watermark is not None:
+                f.flush()
+                f.seek(0)
+                f.write(HEADER.pack(watermark))
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, url: str) -> bool:
+        return url_hash(url) in self._hashes
+
+    def add(self, urls: Iterable[str]):
+        new = [h for h in {url_hash(url) for url in urls} if h not in self._hashes]
+        if new:
+            self._hashes.update(new)
+            self._append(new)
+
+    def sync(self, db: DBHandler, itersize: int = 10000) -> int:
+        """
+        Add the urls of articles stored since the last sync. Returns the number of new urls.
+        Urls already in the index, e.g. those in the margin below the watermark, aren't counted again.
+        """
+        ((max_id,),) = db.run_sql("select coalesce(max(id), 0) from articles")
+        if max_id < self.watermark:
+            # The articles table was recreated, so the index no longer matches it
+            self._reset()
+        new = set()
+        since = max(self.watermark - SYNC_MARGIN_IDS, 0)
+        for (url,) in db.iter_sql(
+            "select url from articles where id > %s and id <= %s", (since, max_id), itersize=itersize
+        ):
+            h = url_hash(url)
+            if h not in self._hashes:
+                new.add(h)
+        self._hashes.update(new)
+        self._append(list(new), watermark=max_id)
+        self.watermark = max_id
+        return len(new)
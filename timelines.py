@@ -2,7 +2,7 @@ import datetime as dt
 import json
 import re
 from collections import namedtuple
-from typing import List
+from typing import List, Optional
 
 import numpy as np
 from hdbscan import HDBSCAN
@@ -10,9 +10,15 @@ from openai import OpenAI
 from openai.types.chat.chat_completion import ChatCompletion
 
 from db.db_connection import DBHandler
+from db.embedding_codec import EMBEDDING_DTYPE, decode_embedding_rows
+from db.keyword_resolver import KeywordResolver
+from db.queries import STORY_EMBEDDINGS_SQL, STORY_WINDOW_SQL
 from digest_status import DigestStatus, digest_status_transition, get_incomplete_digest
+from embedding_backends import EMBEDDING_DIMS
+from embedding_reduction import embedding_dims
+from embedding_store import EMBEDDING_STORE_DIR, EmbeddingStore
 
-StoryInfo = namedtuple("StoryInfo", ["id", "title", "ts", "summary", "coverage", "digest_id", "embedding"])
+StoryInfo = namedtuple("StoryInfo", ["id", "title", "ts", "summary", "coverage", "digest_id"])
 
 
 SUPER_STORY_TIMELINE_RESPONSE_FORMAT = {
@@ -104,27 +110,22 @@ def cluster_criterion(stories: List[StoryInfo], current_digest: tuple[int, Diges
     return True
 
 
-def get_story_embeddings(db: DBHandler) -> list[StoryInfo]:
-    sql_out = db.run_sql(
-        f"""
-        select s.id, s.title, s.ts, s.summary, s.coverage, d.id, e.embedding
-        from stories s
-        left join story_embeddings e
-        on s.id = e.story_id
-        left join digests d
-        on s.digest_id = d.id
-        where s.ts > '{(dt.datetime.now() - dt.timedelta(days=14)).strftime("%Y-%m-%d %H:%M:%S")}'
-        and e.embedding is not null
-    """
-    )
-    return [StoryInfo(a[0], a[1], a[2], a[3], a[4], a[5], eval(a[6])) for a in sql_out]
+def get_story_embeddings(
+    db: DBHandler, dims: int = EMBEDDING_DIMS, store: Optional[EmbeddingStore] = None
+) -> tuple[list[StoryInfo], np.ndarray]:
+    since = dt.datetime.now() - dt.timedelta(days=14)
+    if store is not None:
+        stories = [StoryInfo(*s) for s in db.iter_sql(STORY_WINDOW_SQL, (since, store.row_bytes), itersize=500)]
+        return stories, store.synced_rows(db, [s.id for s in stories])
+    sql_out = db.iter_sql(STORY_EMBEDDINGS_SQL, (since, dims * EMBEDDING_DTYPE.itemsize), itersize=500)
+    return decode_embedding_rows(sql_out, dims, StoryInfo)
 
 
 def cluster_into_super_stories(
-    stories: List[StoryInfo], current_digest: tuple[int, DigestStatus]
+    stories: List[StoryInfo], embeddings: np.ndarray, current_digest: tuple[int, DigestStatus]
 ) -> List[List[StoryInfo]]:
     clusterer = HDBSCAN(min_cluster_size=3, metric="euclidean", cluster_selection_method="eom")
-    labels = clusterer.fit_predict([s.embedding for s in stories])
+    labels = clusterer.fit_predict(embeddings)
     super_stories: list[list[StoryInfo]] = []
     for i in range(len(np.unique(labels))):
         cluster_stories = [s for s, label in zip(stories, labels) if label == i]
@@ -255,54 +256,77 @@ def generate_timelines(super_stories: List[List[StoryInfo]], client: OpenAI) ->
 def write_timelines_to_db(db: DBHandler, timelines: List[dict]):
     print(f"Inserting {len(timelines)} timelines into db")
     digest_id, _ = get_incomplete_digest(db)
+    keyword_resolver = KeywordResolver(db)
 
     for i, timeline in enumerate(timelines):
         print(i + 1, end="\r")
-        db.insert_row(
-            "timelines",
+        with db.transaction():
+            if not write_timeline_to_db(db, timeline, digest_id, keyword_resolver):
+                print(f"Timeline '{timeline['subject']}' already exists in digest {digest_id}, skipping")
+
+
+def write_timeline_to_db(db: DBHandler, timeline: dict, digest_id: int, keyword_resolver: KeywordResolver) -> bool:
+    inserted = db.insert_rows(
+        "timelines",
+        [
             {
                 "ts": timeline["ts"],
                 "digest_id": digest_id,
                 "subject": timeline["subject"],
                 "headline": timeline["headline"],
                 "summary": timeline["summary"],
-            },
-        )
-        timeline_id = db.run_sql("select max(id) from timelines")[0][0]
-        for event in timeline["events"]:
-            db.insert_row(
-                "timeline_events",
-                {
-                    "timeline_id": timeline_id,
-                    "story_id": event["story_id"],
-                    "description": event["event_description"],
-                    "date": event["date"],
-                    "date_type": event["date_type"],
-                },
-            )
-        for story_id in timeline["stories"]:
-            db.insert_row("timeline_stories", {"timeline_id": timeline_id, "story_id": story_id})
-        for keyword in timeline["keywords"]:
-            keyword_id = db.run_sql(
-                "select id from keywords where keyword = %s and type = %s", (keyword["keyword"], keyword["type"])
-            )
-            if not keyword_id:
-                db.insert_row("keywords", {"keyword": keyword["keyword"], "type": keyword["type"]})
-                keyword_id = db.run_sql("select max(id) from keywords")
-            keyword_id = keyword_id[0][0]
-            db.insert_row("timeline_keywords", {"timeline_id": timeline_id, "keyword_id": keyword_id})
+            }
+        ],
+        on_conflict="on constraint unique_timeline do nothing",
+        returning="id",
+    )
+    if not inserted:
+        return False
+    timeline_id = inserted[0][0]
+    db.insert_rows(
+        "timeline_events",
+        [
+            {
+                "timeline_id": timeline_id,
+                "story_id": event["story_id"],
+                "description": event["event_description"],
+                "date": event["date"],
+                "date_type": event["date_type"],
+            }
+            for event in timeline["events"]
+        ],
+        on_conflict="do nothing",
+    )
+    db.insert_rows(
+        "timeline_stories",
+        [{"timeline_id": timeline_id, "story_id": story_id} for story_id in timeline["stories"]],
+        on_conflict="do nothing",
+    )
+    keyword_ids = keyword_resolver.resolve(timeline["keywords"])
+    db.insert_rows(
+        "timeline_keywords",
+        [{"timeline_id": timeline_id, "keyword_id": keyword_id} for keyword_id in keyword_ids],
+        on_conflict="do nothing",
+    )
+    return True
 
 
 @digest_status_transition(
     expected_status=DigestStatus.RUNDOWNS_GENERATED,
     final_status=DigestStatus.READY,
 )
-def cluster_stories_into_timelines(db_config: dict, client: OpenAI, dry_run=False):
+def cluster_stories_into_timelines(
+    db: DBHandler,
+    client: OpenAI,
+    dry_run=False,
+    embedding_dims: int = EMBEDDING_DIMS,
+    store_path: Optional[str] = EMBEDDING_STORE_DIR,
+):
     print("Clustering stories into timelines")
-    db = DBHandler(db_config)
     current_digest = get_incomplete_digest(db)
-    stories = get_story_embeddings(db)
-    super_stories = cluster_into_super_stories(stories, current_digest)
+    store = EmbeddingStore("story_embeddings", embedding_dims, store_path) if store_path else None
+    stories, embeddings = get_story_embeddings(db, embedding_dims, store)
+    super_stories = cluster_into_super_stories(stories, embeddings, current_digest)
     timelines = generate_timelines(super_stories, client)
     if dry_run:
         print(f"Dry run: {len(timelines)} timelines would be written to the database.")
@@ -314,5 +338,13 @@ def cluster_stories_into_timelines(db_config: dict, client: OpenAI, dry_run=Fals
 
 if __name__ == "__main__":
     config = json.load(open("./config.json"))
+    db = DBHandler(config["railway"], pooled=True, **config.get("db_options", {}))
     client = OpenAI(api_key=config["openai_api_key"])
-    cluster_stories_into_timelines(config["railway"], client, dry_run=True)
+    cluster_stories_into_timelines(
+        db,
+        client,
+        dry_run=True,
+        embedding_dims=embedding_dims(config),
+        store_path=config.get("embedding_store", EMBEDDING_STORE_DIR),
+    )
+    db.close()